@@ -0,0 +1,119 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+from collections import Counter
+
+import snapshot
+
+# Graph used by pool workers, memory-mapped from the dataset's snapshot so
+# every process shares the same read-only pages
+_graph = None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python analytics.py [directory] [--sample N]")
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument("--sample", type=int, metavar="N",
+                        help="BFS from N random sources and scale the "
+                             "histograms up, instead of from everyone")
+    parser.add_argument("--seed", type=int, help="seed for --sample")
+    parser.add_argument("--processes", type=int,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--center", metavar="PERSON_ID",
+                        help="also report everyone's distance from this "
+                             "person, e.g. 102 for Bacon numbers")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="rebuild the compact graph snapshot")
+    args = parser.parse_args()
+
+    print("Loading data...", file=sys.stderr)
+    graph = snapshot.load_graph(args.directory, rebuild=args.rebuild)
+    print("Data loaded.", file=sys.stderr)
+
+    sources = range(graph.num_people)
+    if args.sample is not None and args.sample < graph.num_people:
+        sources = random.Random(args.seed).sample(sources, args.sample)
+
+    stats = separation_stats(
+        args.directory, sources, graph.num_people, processes=args.processes
+    )
+    if args.center is not None:
+        center = graph.person_index(args.center)
+        if center is None:
+            sys.exit("Person not found.")
+        stats["center"] = {
+            "person_id": args.center,
+            "histogram": distance_histogram(graph.distances(center)),
+        }
+    print(json.dumps(stats, indent=2))
+
+
+def separation_stats(directory, sources, num_people, processes=None):
+    """
+    Runs a BFS from every person index in `sources` across a process pool
+    and aggregates histograms of degrees of separation and eccentricity.
+    When `sources` is a sample, pair counts are scaled up to estimate the
+    statistics over all ordered pairs.
+    """
+    separation = Counter()
+    eccentricity = Counter()
+    unreachable = 0
+
+    processes = processes or os.cpu_count()
+    chunksize = max(1, len(sources) // (4 * processes))
+    with multiprocessing.Pool(processes, initializer=_init_worker,
+                              initargs=(directory,)) as pool:
+        for histogram, ecc, missed in pool.imap_unordered(
+                _source_stats, sources, chunksize=chunksize):
+            separation.update(histogram)
+            eccentricity[ecc] += 1
+            unreachable += missed
+
+    scale = num_people / len(sources) if sources else 0
+    pairs = sum(separation.values())
+    return {
+        "people": num_people,
+        "sources": len(sources),
+        "sampled": len(sources) < num_people,
+        "separation_histogram": _scaled(separation, scale),
+        "eccentricity_histogram": dict(sorted(eccentricity.items())),
+        "unreachable_pairs": round(unreachable * scale),
+        "mean_separation": (
+            sum(d * c for d, c in separation.items()) / pairs if pairs else None
+        ),
+    }
+
+
+def distance_histogram(depth):
+    """
+    Returns {distance: people} for a depth array, leaving out the root
+    and anyone unreachable.
+    """
+    histogram = Counter(depth)
+    histogram.pop(-1, None)
+    histogram.pop(0, None)
+    return dict(sorted(histogram.items()))
+
+
+def _init_worker(directory):
+    global _graph
+    _graph = snapshot.load_graph(directory)
+
+
+def _source_stats(source):
+    depth = _graph.distances(source)
+    histogram = distance_histogram(depth)
+    missed = len(depth) - 1 - sum(histogram.values())
+    return histogram, max(histogram, default=0), missed
+
+
+def _scaled(histogram, scale):
+    return {d: round(c * scale) for d, c in sorted(histogram.items())}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+from bisect import bisect
+
+import degrees
+import landmarks
+import snapshot
+
+# (backend, mode) pairs run by default; bipartite only exists on dicts
+STRATEGIES = (
+    ("dict", "flattened"),
+    ("dict", "bipartite"),
+    ("dict", "bidirectional"),
+    ("compact", "flattened"),
+    ("compact", "bidirectional"),
+    ("compact", "astar"),
+)
+
+SYLLABLES = (
+    "an", "bel", "car", "dan", "el", "fra", "gre", "han", "is", "jo",
+    "ka", "lin", "mar", "nor", "ol", "pet", "quin", "ros", "sam", "tor",
+    "ul", "ver", "wil", "xa", "yor", "zel",
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python benchmark.py {generate,run} directory [options]")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser(
+        "generate", help="write synthetic people/movies/stars CSVs")
+    generate_parser.add_argument("directory")
+    generate_parser.add_argument("--edges", type=int, default=10000,
+                                 help="number of stars rows to write")
+    generate_parser.add_argument("--alpha", type=float, default=2.5,
+                                 help="power-law exponent (> 1) of cast "
+                                      "sizes and of people's movie counts")
+    generate_parser.add_argument("--max-cast", type=int, default=200,
+                                 help="largest cast of any one movie")
+    generate_parser.add_argument("--seed", type=int, default=0)
+
+    run_parser = commands.add_parser(
+        "run", help="time every search strategy on a fixed query set")
+    run_parser.add_argument("directory")
+    run_parser.add_argument("--queries", type=int, default=200)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--landmarks", type=int,
+                            default=landmarks.DEFAULT_LANDMARKS)
+    run_parser.add_argument("--strategies", nargs="+",
+                            metavar="BACKEND:MODE",
+                            default=[f"{b}:{m}" for b, m in STRATEGIES])
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        stats = generate(args.directory, args.edges, args.alpha,
+                         args.max_cast, args.seed)
+    else:
+        strategies = [tuple(s.split(":", 1)) for s in args.strategies]
+        stats = run(args.directory, strategies, args.queries, args.seed,
+                    args.landmarks)
+    print(json.dumps(stats, indent=2))
+
+
+def generate(directory, num_edges, alpha=2.5, max_cast=200, seed=0):
+    """
+    Writes people.csv, movies.csv and stars.csv with `num_edges` stars
+    rows to `directory`. Cast sizes follow a power law with exponent
+    `alpha`, capped at `max_cast`, and so does how many movies each
+    person is in. Names are built from syllables, so some people share
+    a name.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    num_people = max(2, num_edges // 4)
+    with open(os.path.join(directory, "people.csv"), "w",
+              encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "birth"])
+        for person_id in range(num_people):
+            writer.writerow([person_id, _name(rng), rng.randint(1900, 2010)])
+
+    # Popularity weights: person i is picked with weight (i + 1) ** -1/(a-1)
+    exponent = -1 / (alpha - 1)
+    cum_weights = []
+    total = 0
+    for i in range(num_people):
+        total += (i + 1) ** exponent
+        cum_weights.append(total)
+
+    num_movies = 0
+    edges = 0
+    with open(os.path.join(directory, "movies.csv"), "w",
+              encoding="utf-8", newline="") as movies_file, \
+            open(os.path.join(directory, "stars.csv"), "w",
+                 encoding="utf-8", newline="") as stars_file:
+        movies_writer = csv.writer(movies_file)
+        stars_writer = csv.writer(stars_file)
+        movies_writer.writerow(["id", "title", "year"])
+        stars_writer.writerow(["person_id", "movie_id"])
+        while edges < num_edges:
+            movie_id = 1000000 + num_movies
+            num_movies += 1
+            movies_writer.writerow(
+                [movie_id, f"Movie {num_movies}", rng.randint(1920, 2024)]
+            )
+            cast_size = min(
+                num_edges - edges, num_people, max_cast,
+                1 + int(rng.paretovariate(alpha - 1)),
+            )
+            cast = set()
+            while len(cast) < cast_size:
+                cast.add(min(num_people - 1,
+                             bisect(cum_weights, rng.random() * total)))
+            for person_id in cast:
+                stars_writer.writerow([person_id, movie_id])
+            edges += cast_size
+
+    return {"people": num_people, "movies": num_movies, "stars": edges}
+
+
+def run(directory, strategies, num_queries=200, seed=0, num_landmarks=16):
+    """
+    Runs every (backend, mode) strategy on the same random queries, each
+    in a fresh process that loads its backend, so peak memory is its
+    own. Returns each backend's load time and peak RSS from its first
+    strategy's run, and per-strategy latency, nodes expanded and peak
+    RSS, with how many path lengths disagree with the first strategy's.
+    """
+    with open(os.path.join(directory, "people.csv"), encoding="utf-8") as f:
+        person_ids = [row["id"] for row in csv.DictReader(f)]
+    rng = random.Random(seed)
+    queries = [
+        (rng.choice(person_ids), rng.choice(person_ids))
+        for _ in range(num_queries)
+    ]
+    del person_ids
+
+    # Build the snapshot and landmark index up front so that timing the
+    # compact backend measures loading them, not writing them
+    if any(backend == "compact" for backend, _ in strategies):
+        started = time.perf_counter()
+        _in_subprocess(_prepare_compact, directory, num_landmarks)
+        prepare_s = time.perf_counter() - started
+    else:
+        prepare_s = None
+
+    results = {
+        "directory": directory,
+        "queries": num_queries,
+        "seed": seed,
+        "compact_prepare_s": prepare_s,
+        "backends": {},
+        "strategies": [],
+    }
+    reference = None
+    for backend, mode in strategies:
+        report = _in_subprocess(
+            _run_strategy, directory, backend, mode, queries, num_landmarks
+        )
+        results["backends"].setdefault(backend, report["load"])
+        strategy = report["strategy"]
+        lengths = strategy.pop("lengths")
+        if reference is None:
+            reference = lengths
+        strategy["mismatches"] = sum(
+            a != b for a, b in zip(lengths, reference)
+        )
+        results["strategies"].append(strategy)
+    return results
+
+
+def _in_subprocess(function, *args):
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def _prepare_compact(directory, num_landmarks):
+    graph = snapshot.load_graph(directory)
+    landmarks.load_index(directory, graph, num_landmarks)
+
+
+def _run_strategy(directory, backend, mode, queries, num_landmarks):
+    compact = backend == "compact"
+    started = time.perf_counter()
+    degrees.load_data(
+        directory, compact=compact,
+        num_landmarks=num_landmarks if compact and mode == "astar" else 0,
+    )
+    load = {"load_s": time.perf_counter() - started, "peak_rss_mb": _peak_rss()}
+
+    latencies = []
+    lengths = []
+    expanded = 0
+    for source, target in queries:
+        before = _expanded()
+        started = time.perf_counter()
+        path = degrees.shortest_path(source, target, mode=mode)
+        latencies.append(time.perf_counter() - started)
+        expanded += _expanded() - before
+        lengths.append(None if path is None else len(path))
+    latencies.sort()
+    strategy = {
+        "backend": backend,
+        "mode": mode,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "mean_expanded": expanded / len(queries) if queries else 0,
+        "peak_rss_mb": _peak_rss(),
+        "lengths": lengths,
+    }
+    return {"load": load, "strategy": strategy}
+
+
+def _expanded():
+    if degrees.graph is not None:
+        return degrees.graph.expanded
+    return degrees.expanded
+
+
+def _peak_rss():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def _percentile(values, q):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _name(rng):
+    def word():
+        return "".join(
+            rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))
+        ).capitalize()
+    return f"{word()} {word()}"
+
+
+if __name__ == "__main__":
+    main()
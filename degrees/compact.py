@@ -0,0 +1,314 @@
+import csv
+from array import array
+from bisect import bisect_left
+
+# Typecode used for every offset/index array. 4-byte signed ints are plenty
+# for the IMDB extract and keep the arrays half the size of "q".
+INDEX_TYPECODE = "i"
+
+
+class CompactGraph():
+    """
+    Integer-indexed people/movies graph.
+
+    Person and movie ids are interned to dense integers in sorted id order,
+    so index -> id is a list lookup and id -> index is a binary search.
+    The bipartite adjacency is kept as two CSR structures:
+
+        person_offsets[p] .. person_offsets[p + 1] slices person_movies
+        movie_offsets[m]  .. movie_offsets[m + 1]  slices movie_people
+    """
+
+    def __init__(self, person_ids, person_names, person_births,
+                 movie_ids, movie_titles, movie_years,
+                 person_offsets, person_movies, movie_offsets, movie_people,
+                 name_order=None):
+        self.person_ids = person_ids
+        self.person_names = person_names
+        self.person_births = person_births
+        self.movie_ids = movie_ids
+        self.movie_titles = movie_titles
+        self.movie_years = movie_years
+        self.person_offsets = person_offsets
+        self.person_movies = person_movies
+        self.movie_offsets = movie_offsets
+        self.movie_people = movie_people
+        if name_order is None:
+            name_order = array(INDEX_TYPECODE, sorted(
+                range(len(person_names)), key=lambda i: person_names[i].lower()
+            ))
+        # Person indexes sorted by lowercase name, for name lookups
+        self.name_order = name_order
+        # Running count of people whose co-stars a search has scanned
+        self.expanded = 0
+
+    @classmethod
+    def from_csv(cls, directory):
+        """
+        Build a compact graph straight from the people/movies/stars CSVs.
+        """
+        with open(f"{directory}/people.csv", encoding="utf-8") as f:
+            people = sorted(
+                (row["id"], row["name"], row["birth"])
+                for row in csv.DictReader(f)
+            )
+        with open(f"{directory}/movies.csv", encoding="utf-8") as f:
+            movies = sorted(
+                (row["id"], row["title"], row["year"])
+                for row in csv.DictReader(f)
+            )
+
+        person_ids = [p[0] for p in people]
+        movie_ids = [m[0] for m in movies]
+        person_index = {person_id: i for i, person_id in enumerate(person_ids)}
+        movie_index = {movie_id: i for i, movie_id in enumerate(movie_ids)}
+
+        # Edge list; rows naming an unknown person or movie are skipped
+        edge_people = array(INDEX_TYPECODE)
+        edge_movies = array(INDEX_TYPECODE)
+        with open(f"{directory}/stars.csv", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    p = person_index[row["person_id"]]
+                    m = movie_index[row["movie_id"]]
+                except KeyError:
+                    continue
+                edge_people.append(p)
+                edge_movies.append(m)
+        del person_index, movie_index
+
+        person_offsets, person_movies = build_csr(
+            edge_people, edge_movies, len(person_ids))
+        movie_offsets, movie_people = build_csr(
+            edge_movies, edge_people, len(movie_ids))
+
+        return cls(
+            person_ids, [p[1] for p in people], [p[2] for p in people],
+            movie_ids, [m[1] for m in movies], [m[2] for m in movies],
+            person_offsets, person_movies, movie_offsets, movie_people,
+        )
+
+    @property
+    def num_people(self):
+        return len(self.person_offsets) - 1
+
+    @property
+    def num_movies(self):
+        return len(self.movie_offsets) - 1
+
+    def person_index(self, person_id):
+        """
+        Returns the dense index for an IMDB person id, or None.
+        """
+        return _find(self.person_ids, person_id)
+
+    def movie_index(self, movie_id):
+        """
+        Returns the dense index for an IMDB movie id, or None.
+        """
+        return _find(self.movie_ids, movie_id)
+
+    def person_ids_for_name(self, name):
+        """
+        Returns the IMDB ids of every person whose name matches `name`,
+        ignoring case.
+        """
+        name = name.lower()
+        order = self.name_order
+        names = self.person_names
+        i = bisect_left(order, name, key=lambda p: names[p].lower())
+        ids = []
+        while i < len(order) and names[order[i]].lower() == name:
+            ids.append(self.person_ids[order[i]])
+            i += 1
+        return ids
+
+    def movies_of(self, person):
+        """
+        Returns the movie indexes `person` starred in.
+        """
+        offsets = self.person_offsets
+        return self.person_movies[offsets[person]:offsets[person + 1]]
+
+    def stars_of(self, movie):
+        """
+        Returns the person indexes starring in `movie`.
+        """
+        offsets = self.movie_offsets
+        return self.movie_people[offsets[movie]:offsets[movie + 1]]
+
+    def neighbors(self, person):
+        """
+        Yields (movie, person) index pairs for people who starred with
+        `person`, including `person` itself, like neighbors_for_person.
+        """
+        person_offsets = self.person_offsets
+        person_movies = self.person_movies
+        movie_offsets = self.movie_offsets
+        movie_people = self.movie_people
+        self.expanded += 1
+        for i in range(person_offsets[person], person_offsets[person + 1]):
+            movie = person_movies[i]
+            for j in range(movie_offsets[movie], movie_offsets[movie + 1]):
+                yield movie, movie_people[j]
+
+    def bfs(self, source, targets=None):
+        """
+        Breadth-first search over person indexes starting at `source`.
+
+        Returns (parent_movie, parent_person) arrays: for every reached
+        person p other than the source, parent_person[p] is the person it
+        was discovered from and parent_movie[p] the movie they share.
+        Unreached people have parent_person[p] == -1. If `targets` is
+        given, the search stops as soon as all of them are discovered.
+
+        Each movie is expanded at most once, and the queue is a
+        preallocated array, so expansion does no per-neighbor allocation.
+        """
+        person_offsets = self.person_offsets
+        person_movies = self.person_movies
+        movie_offsets = self.movie_offsets
+        movie_people = self.movie_people
+
+        n = self.num_people
+        parent_person = array(INDEX_TYPECODE, [-1]) * n
+        parent_movie = array(INDEX_TYPECODE, [-1]) * n
+        seen_movies = bytearray(self.num_movies)
+        queue = array(INDEX_TYPECODE, [0]) * n
+
+        parent_person[source] = source
+        if targets is not None:
+            remaining = set(targets)
+            remaining.discard(source)
+            if not remaining:
+                return parent_movie, parent_person
+        else:
+            remaining = ()
+
+        queue[0] = source
+        head, tail = 0, 1
+        while head < tail:
+            person = queue[head]
+            head += 1
+            for i in range(person_offsets[person], person_offsets[person + 1]):
+                movie = person_movies[i]
+                if seen_movies[movie]:
+                    continue
+                seen_movies[movie] = 1
+                for j in range(movie_offsets[movie], movie_offsets[movie + 1]):
+                    star = movie_people[j]
+                    if parent_person[star] != -1:
+                        continue
+                    parent_person[star] = person
+                    parent_movie[star] = movie
+                    if star in remaining:
+                        remaining.discard(star)
+                        if not remaining:
+                            self.expanded += head
+                            return parent_movie, parent_person
+                    queue[tail] = star
+                    tail += 1
+
+        self.expanded += head
+        return parent_movie, parent_person
+
+    def distances(self, source):
+        """
+        Returns an array of BFS depths (degrees of separation) from
+        `source` to every person, with -1 for people it cannot reach.
+        """
+        person_offsets = self.person_offsets
+        person_movies = self.person_movies
+        movie_offsets = self.movie_offsets
+        movie_people = self.movie_people
+
+        n = self.num_people
+        depth = array(INDEX_TYPECODE, [-1]) * n
+        seen_movies = bytearray(self.num_movies)
+        queue = array(INDEX_TYPECODE, [0]) * n
+
+        depth[source] = 0
+        queue[0] = source
+        head, tail = 0, 1
+        while head < tail:
+            person = queue[head]
+            head += 1
+            next_depth = depth[person] + 1
+            for i in range(person_offsets[person], person_offsets[person + 1]):
+                movie = person_movies[i]
+                if seen_movies[movie]:
+                    continue
+                seen_movies[movie] = 1
+                for j in range(movie_offsets[movie], movie_offsets[movie + 1]):
+                    star = movie_people[j]
+                    if depth[star] == -1:
+                        depth[star] = next_depth
+                        queue[tail] = star
+                        tail += 1
+
+        self.expanded += head
+        return depth
+
+    def path_to(self, parents, source, target):
+        """
+        Walks the arrays returned by bfs back from `target` and returns the
+        (movie_id, person_id) path from `source`, or None if unreached.
+        """
+        parent_movie, parent_person = parents
+        if parent_person[target] == -1:
+            return None
+        path = []
+        person = target
+        while person != source:
+            path.append(
+                (self.movie_ids[parent_movie[person]], self.person_ids[person])
+            )
+            person = parent_person[person]
+        path.reverse()
+        return path
+
+    def shortest_path(self, source, target):
+        """
+        Returns the shortest (movie_id, person_id) path between two
+        person indexes, or None if they are not connected.
+        """
+        return self.path_to(self.bfs(source, (target,)), source, target)
+
+
+def build_csr(rows, cols, size):
+    """
+    Builds (offsets, indices) for a CSR matrix with `size` rows from
+    parallel row/column arrays. Columns within a row are sorted and
+    duplicates dropped, matching the set semantics of load_data.
+    """
+    counts = array(INDEX_TYPECODE, [0]) * (size + 1)
+    for r in rows:
+        counts[r + 1] += 1
+    for r in range(size):
+        counts[r + 1] += counts[r]
+
+    cursor = array(INDEX_TYPECODE, counts)
+    indices = array(INDEX_TYPECODE, [0]) * len(rows)
+    for r, c in zip(rows, cols):
+        indices[cursor[r]] = c
+        cursor[r] += 1
+    del cursor
+
+    # Sort and deduplicate each row in place, compacting as we go
+    offsets = array(INDEX_TYPECODE, [0]) * (size + 1)
+    write = 0
+    for r in range(size):
+        row = sorted(set(indices[counts[r]:counts[r + 1]]))
+        indices[write:write + len(row)] = array(INDEX_TYPECODE, row)
+        write += len(row)
+        offsets[r + 1] = write
+    del indices[write:]
+
+    return offsets, indices
+
+
+def _find(sorted_ids, key):
+    i = bisect_left(sorted_ids, key)
+    if i < len(sorted_ids) and sorted_ids[i] == key:
+        return i
+    return None
@@ -1,6 +1,13 @@
+import argparse
 import csv
+import errno
+import json
+import os
 import sys
 
+import landmarks
+import snapshot
+from nameindex import NameIndex
 from util import Node, StackFrontier, QueueFrontier
 
 # Maps names to a set of corresponding person_ids
@@ -12,11 +19,51 @@ people = {}
 # Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
 movies = {}
 
+# CompactGraph holding the same data when loaded with compact=True,
+# in which case names, people and movies stay empty
+graph = None
 
-def load_data(directory):
+# LandmarkIndex over graph, when loaded with num_landmarks
+landmark_index = None
+
+# NameIndex for prefix and typo-tolerant name lookup, when loaded
+# with index_names
+name_index = None
+
+# Running count of people whose co-stars the dict backend searches have
+# scanned, for benchmarking (the compact graph keeps its own)
+expanded = 0
+
+# Strategies shortest_path can dispatch to
+SEARCH_MODES = ("flattened", "bipartite", "bidirectional", "astar")
+
+# How person_id_for_name picks among several matching people: ask on
+# stdin, give up unless there is exactly one, or take the person with
+# the most movies
+RESOLVE_POLICIES = ("ask", "unique", "most-connected")
+
+
+def load_data(directory, compact=False, rebuild=False, num_landmarks=0,
+              index_names=False):
     """
     Load data from CSV files into memory.
+    With `compact`, load an integer-indexed CSR graph instead of dicts,
+    memory-mapped from the directory's snapshot unless the CSVs changed
+    or `rebuild` is set. `num_landmarks` also loads (or builds) that many
+    landmark distances for A* search, and `index_names` builds the name
+    index used for prefix and fuzzy lookup.
     """
+    global graph, landmark_index
+    if compact:
+        graph = snapshot.load_graph(directory, rebuild=rebuild)
+        if num_landmarks:
+            landmark_index = landmarks.load_index(
+                directory, graph, num_landmarks, rebuild=rebuild
+            )
+        if index_names:
+            build_name_index()
+        return
+
     # Load people
     with open(f"{directory}/people.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -51,25 +98,162 @@ def load_data(directory):
             except KeyError:
                 pass
 
+    if index_names:
+        build_name_index()
+
+
+def build_name_index():
+    """
+    Builds name_index over whichever backend is loaded.
+    """
+    global name_index
+    if graph is not None:
+        entries = zip(graph.person_ids, graph.person_names)
+    else:
+        entries = ((person_id, p["name"]) for person_id, p in people.items())
+    name_index = NameIndex(entries, connections)
+
+
+def load_updates(directory):
+    """
+    Applies the rows of any people.csv, movies.csv and stars.csv chunks in
+    `directory` (e.g. a daily delta) with apply_updates, and returns the
+    person ids whose neighbors changed.
+    """
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(errno.ENOENT, "No such directory", directory)
+    rows = {}
+    for table in ("people", "movies", "stars"):
+        try:
+            with open(f"{directory}/{table}.csv", encoding="utf-8") as f:
+                rows[table] = list(csv.DictReader(f))
+        except FileNotFoundError:
+            rows[table] = []
+    return apply_updates(rows["people"], rows["movies"], rows["stars"])
+
+
+def apply_updates(people_rows=(), movies_rows=(), stars_rows=()):
+    """
+    Applies appended people/movies/stars CSV rows (as dicts, like
+    csv.DictReader yields) to names, people, movies and the name index
+    in place, instead of reloading everything.
+
+    Returns the set of person ids that gained co-stars: every new path
+    in the graph passes between two of them.
+    """
+    if graph is not None:
+        raise ValueError("incremental updates need the dict backend")
+
+    for row in people_rows:
+        person = people.setdefault(row["id"], {"movies": set()})
+        old_name = person.get("name")
+        person["name"] = row["name"]
+        person["birth"] = row["birth"]
+        if old_name is not None and old_name.lower() != row["name"].lower():
+            names[old_name.lower()].discard(row["id"])
+            if name_index is not None:
+                name_index.remove(row["id"], old_name)
+        names.setdefault(row["name"].lower(), set()).add(row["id"])
+        if name_index is not None:
+            name_index.add(row["id"], row["name"])
+
+    for row in movies_rows:
+        movie = movies.setdefault(row["id"], {"stars": set()})
+        movie["title"] = row["title"]
+        movie["year"] = row["year"]
+
+    touched = set()
+    for row in stars_rows:
+        person_id, movie_id = row["person_id"], row["movie_id"]
+        if person_id not in people or movie_id not in movies:
+            continue
+        stars = movies[movie_id]["stars"]
+        if person_id in stars:
+            continue
+        touched.add(person_id)
+        touched.update(stars)
+        stars.add(person_id)
+        people[person_id]["movies"].add(movie_id)
+        if name_index is not None:
+            name_index.reorder(people[person_id]["name"])
+
+    return touched
+
+
+def separation_from(person_ids, max_depth=None):
+    """
+    Multi-source BFS: returns {person_id: degrees of separation from the
+    nearest of `person_ids`} for everyone within `max_depth`.
+    """
+    distance = dict.fromkeys(person_ids, 0)
+    level = list(distance)
+    depth = 0
+    while level and (max_depth is None or depth < max_depth):
+        depth += 1
+        next_level = []
+        for person_id in level:
+            for (_movie_id, star_id) in neighbors_for_person(person_id):
+                if star_id not in distance:
+                    distance[star_id] = depth
+                    next_level.append(star_id)
+        level = next_level
+    return distance
+
 
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+    parser = argparse.ArgumentParser(usage="python degrees.py [directory]")
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument("--compact", action="store_true",
+                        help="use the integer-indexed CSR graph")
+    parser.add_argument("--mode", choices=SEARCH_MODES, default="flattened",
+                        help="search strategy used by shortest_path")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="rebuild the compact graph snapshot")
+    parser.add_argument("--landmarks", type=int, metavar="K",
+                        help="landmarks for --mode astar (default: "
+                             f"{landmarks.DEFAULT_LANDMARKS})")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="answer source,target pairs from FILE ('-' for "
+                             "stdin) and print JSON lines")
+    parser.add_argument("--resolve", choices=RESOLVE_POLICIES,
+                        help="how to pick among people sharing a name "
+                             "(default: ask, or unique with --batch)")
+    parser.add_argument("--fuzzy", action="store_true",
+                        help="index names and suggest close matches for "
+                             "names that are not found")
+    args = parser.parse_args()
+    if args.resolve is None:
+        args.resolve = "unique" if args.batch else "ask"
+    elif args.resolve == "ask" and args.batch:
+        parser.error("--resolve ask cannot be used with --batch")
+    if args.mode == "astar":
+        args.compact = True
+        if args.landmarks is None:
+            args.landmarks = landmarks.DEFAULT_LANDMARKS
 
     # Load data from files into memory
-    print("Loading data...")
-    load_data(directory)
-    print("Data loaded.")
-
-    source = person_id_for_name(input("Name: "))
+    log = sys.stderr if args.batch else sys.stdout
+    print("Loading data...", file=log)
+    load_data(args.directory, compact=args.compact, rebuild=args.rebuild,
+              num_landmarks=args.landmarks or 0, index_names=args.fuzzy)
+    print("Data loaded.", file=log)
+
+    if args.batch:
+        if args.batch == "-":
+            run_batch(sys.stdin, sys.stdout, args.resolve)
+        else:
+            with open(args.batch, encoding="utf-8") as f:
+                run_batch(f, sys.stdout, args.resolve)
+        return
+
+    source = person_id_for_name(input("Name: "), args.resolve)
     if source is None:
         sys.exit("Person not found.")
-    target = person_id_for_name(input("Name: "))
+    target = person_id_for_name(input("Name: "), args.resolve)
     if target is None:
         sys.exit("Person not found.")
 
-    path = shortest_path(source, target)
+    path = shortest_path(source, target, mode=args.mode)
 
     if path is None:
         print("Not connected.")
@@ -78,15 +262,32 @@ def main():
         print(f"{degrees} degrees of separation.")
         path = [(None, source)] + path
         for i in range(degrees):
-            person1 = people[path[i][1]]["name"]
-            person2 = people[path[i + 1][1]]["name"]
-            movie = movies[path[i + 1][0]]["title"]
+            person1 = person_name(path[i][1])
+            person2 = person_name(path[i + 1][1])
+            movie = movie_title(path[i + 1][0])
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
-def shortest_path(source, target):
-    # result = shortest_path_explicit_bipartite(source, target)
-    result = shortest_path_flattened(source, target)
-    return result
+def shortest_path(source, target, mode="flattened"):
+    """
+    Returns the shortest list of (movie_id, person_id) pairs
+    that connect the source to the target, using the search
+    strategy named by `mode` (one of SEARCH_MODES).
+    """
+    if mode == "flattened":
+        return shortest_path_flattened(source, target)
+    elif mode == "bipartite":
+        if graph is not None:
+            raise ValueError("bipartite search needs the dict backend")
+        return shortest_path_explicit_bipartite(source, target)
+    elif mode == "bidirectional":
+        return shortest_path_bidirectional(source, target)
+    elif mode == "astar":
+        if landmark_index is None:
+            raise ValueError("A* search needs a landmark index")
+        return landmark_index.shortest_path(
+            graph.person_index(source), graph.person_index(target)
+        )
+    raise ValueError(f"unknown search mode: {mode}")
 
 """
 This thing is flaky wtf
@@ -95,6 +296,7 @@ def shortest_path_explicit_bipartite(source, target):
     """
         Explicitly traverses the graph in its bipartite nature (person -> movie -> person -> movie)
     """
+    global expanded
     queue = QueueFrontier()
     visited_people = set()
     visited_movies = set()
@@ -122,6 +324,7 @@ def shortest_path_explicit_bipartite(source, target):
 
             star_to_parent[star_id] = movie_id
             if (star_id != target):
+                expanded += 1
                 for starred_movie_id in people[star_id]['movies']:
                     if (starred_movie_id in visited_movies): continue
                     movie_to_parent[starred_movie_id] = star_id
@@ -143,6 +346,10 @@ def shortest_path_flattened(source, target):
     """
     Traverses the flattened bipartite graph source -> (movie, person) -> (movie, person)
     """
+    if graph is not None:
+        return graph.shortest_path(
+            graph.person_index(source), graph.person_index(target)
+        )
 
     queue = QueueFrontier()
     visited_stars = set()
@@ -173,20 +380,237 @@ def shortest_path_flattened(source, target):
 
     return None
 
-def person_id_for_name(name):
+def shortest_path_bidirectional(source, target):
+    """
+    Grows BFS frontiers from both the source and the target, always
+    expanding the smaller frontier by a whole level, and stitches the
+    (movie_id, person_id) path together where the two searches meet.
+    """
+    if graph is None:
+        return bidirectional_search(source, target, neighbors_for_person)
+
+    path = bidirectional_search(
+        graph.person_index(source), graph.person_index(target), graph.neighbors
+    )
+    if path is None:
+        return None
+    return [(graph.movie_ids[m], graph.person_ids[p]) for m, p in path]
+
+
+def bidirectional_search(source, target, neighbors):
+    """
+    Bidirectional BFS over any person ids, given a `neighbors` function
+    yielding (movie, person) pairs. Returns a (movie, person) path or None.
+    """
+    if source == target:
+        return []
+
+    # person -> (depth, movie, person one step closer to the search root)
+    seen = ({source: (0, None, None)}, {target: (0, None, None)})
+    frontiers = [[source], [target]]
+
+    while frontiers[0] and frontiers[1]:
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        mine, other = seen[side], seen[1 - side]
+
+        # Finish the whole level before stitching, so the meeting point
+        # with the smallest combined depth wins
+        meet = None
+        next_frontier = []
+        for person in frontiers[side]:
+            depth = mine[person][0] + 1
+            for movie_id, star_id in neighbors(person):
+                if star_id in mine:
+                    continue
+                mine[star_id] = (depth, movie_id, person)
+                next_frontier.append(star_id)
+                if star_id in other:
+                    total = depth + other[star_id][0]
+                    if meet is None or total < meet[0]:
+                        meet = (total, star_id)
+
+        if meet is not None:
+            return _stitch_path(seen, meet[1])
+        frontiers[side] = next_frontier
+
+    return None
+
+
+def _stitch_path(seen, meet):
+    forward, backward = seen
+    path = []
+    person = meet
+    while forward[person][2] is not None:
+        _, movie_id, parent = forward[person]
+        path.append((movie_id, person))
+        person = parent
+    path.reverse()
+
+    person = meet
+    while backward[person][2] is not None:
+        _, movie_id, child = backward[person]
+        path.append((movie_id, child))
+        person = child
+    return path
+
+
+def shortest_paths_batch(pairs):
+    """
+    Answers many (source, target) queries, growing one BFS tree per
+    distinct source and reading every target's path off it.
+    Returns paths (or None when not connected) in the order of `pairs`.
+    """
+    by_source = {}
+    for i, (source, target) in enumerate(pairs):
+        by_source.setdefault(source, []).append(i)
+
+    results = [None] * len(pairs)
+    for source, indexes in by_source.items():
+        tree = bfs_tree(source, {pairs[i][1] for i in indexes})
+        for i in indexes:
+            results[i] = path_in_tree(tree, source, pairs[i][1])
+    return results
+
+
+def bfs_tree(source, targets=None):
+    """
+    Runs the flattened BFS from `source` without stopping at a single
+    target, stopping early once every one of `targets` is reached.
+    Returns a tree to pass to path_in_tree.
+    """
+    if graph is not None:
+        if targets is not None:
+            targets = [graph.person_index(t) for t in targets]
+        return graph.bfs(graph.person_index(source), targets)
+
+    queue = QueueFrontier()
+    parents = {source: None}
+    remaining = set(targets) - {source} if targets is not None else None
+    queue.add(source)
+    while not queue.empty() and remaining != set():
+        person_id = queue.remove()
+        for (movie_id, star_id) in neighbors_for_person(person_id):
+            if star_id in parents:
+                continue
+            parents[star_id] = (movie_id, person_id)
+            queue.add(star_id)
+            if remaining is not None:
+                remaining.discard(star_id)
+    return parents
+
+
+def path_in_tree(tree, source, target):
+    """
+    Returns the (movie_id, person_id) path from `source` to `target`
+    in a tree built by bfs_tree, or None if `target` was not reached.
+    """
+    if graph is not None:
+        return graph.path_to(
+            tree, graph.person_index(source), graph.person_index(target)
+        )
+
+    if target not in tree:
+        return None
+    path = []
+    person_id = target
+    while person_id != source:
+        (movie_id, parent) = tree[person_id]
+        path.append((movie_id, person_id))
+        person_id = parent
+    path.reverse()
+    return path
+
+
+def run_batch(infile, outfile, policy="unique"):
+    """
+    Reads "source,target" lines from `infile`, each a person id or a
+    name resolved with `policy`, and writes one JSON result per line to
+    `outfile` in input order.
+    """
+    queries = []
+    for row in csv.reader(infile):
+        if not row or row[0].startswith("#"):
+            continue
+        if len(row) != 2:
+            queries.append((row, None, None))
+            continue
+        source, target = (field.strip() for field in row)
+        queries.append(
+            (
+                (source, target),
+                resolve_person(source, policy),
+                resolve_person(target, policy),
+            )
+        )
+
+    pairs = [(s, t) for _, s, t in queries if s is not None and t is not None]
+    paths = iter(shortest_paths_batch(pairs))
+
+    for query, source, target in queries:
+        if len(query) != 2:
+            result = {"query": query, "error": "expected source,target"}
+        elif source is None or target is None:
+            result = {
+                "source": query[0],
+                "target": query[1],
+                "error": "person not found",
+            }
+        else:
+            path = next(paths)
+            result = {
+                "source": source,
+                "target": target,
+                "degrees": None if path is None else len(path),
+                "path": path,
+            }
+        outfile.write(json.dumps(result) + "\n")
+
+
+def resolve_person(field, policy="unique"):
+    """
+    Returns the person id for a query field: the field itself if it
+    is a known id, else the person with that name chosen by `policy`.
+    """
+    if graph is not None:
+        if graph.person_index(field) is not None:
+            return field
+    elif field in people:
+        return field
+    return person_id_for_name(field, policy)
+
+
+def person_id_for_name(name, policy="ask"):
     """
     Returns the IMDB id for a person's name,
-    resolving ambiguities as needed.
+    resolving ambiguities as needed according to `policy`
+    (one of RESOLVE_POLICIES). With a name index loaded, names that
+    are not found fall back to the closest fuzzy matches.
     """
-    person_ids = list(names.get(name.lower(), set()))
+    if name_index is not None:
+        person_ids = name_index.exact(name)
+        if len(person_ids) == 0:
+            person_ids = name_index.search(name, limit=5)
+            if person_ids and policy != "ask":
+                # Only pick among people with the closest matching name
+                best = person_name(person_ids[0]).lower()
+                person_ids = [
+                    p for p in person_ids if person_name(p).lower() == best
+                ]
+    elif graph is not None:
+        person_ids = graph.person_ids_for_name(name)
+    else:
+        person_ids = list(names.get(name.lower(), set()))
     if len(person_ids) == 0:
         return None
+    elif len(person_ids) > 1 and policy == "unique":
+        return None
+    elif len(person_ids) > 1 and policy == "most-connected":
+        return max(person_ids, key=connections)
     elif len(person_ids) > 1:
         print(f"Which '{name}'?")
         for person_id in person_ids:
-            person = people[person_id]
-            name = person["name"]
-            birth = person["birth"]
+            name = person_name(person_id)
+            birth = person_birth(person_id)
             print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
         try:
             person_id = input("Intended Person ID: ")
@@ -204,6 +628,13 @@ def neighbors_for_person(person_id):
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
     """
+    global expanded
+    if graph is not None:
+        return {
+            (graph.movie_ids[m], graph.person_ids[p])
+            for m, p in graph.neighbors(graph.person_index(person_id))
+        }
+    expanded += 1
     movie_ids = people[person_id]["movies"]
     neighbors = set()
     for movie_id in movie_ids:
@@ -212,5 +643,33 @@ def neighbors_for_person(person_id):
     return neighbors
 
 
+def connections(person_id):
+    """
+    Returns the number of movies a person starred in.
+    """
+    if graph is not None:
+        person = graph.person_index(person_id)
+        return graph.person_offsets[person + 1] - graph.person_offsets[person]
+    return len(people[person_id]["movies"])
+
+
+def person_name(person_id):
+    if graph is not None:
+        return graph.person_names[graph.person_index(person_id)]
+    return people[person_id]["name"]
+
+
+def person_birth(person_id):
+    if graph is not None:
+        return graph.person_births[graph.person_index(person_id)]
+    return people[person_id]["birth"]
+
+
+def movie_title(movie_id):
+    if graph is not None:
+        return graph.movie_titles[graph.movie_index(movie_id)]
+    return movies[movie_id]["title"]
+
+
 if __name__ == "__main__":
     main()
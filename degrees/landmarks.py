@@ -0,0 +1,186 @@
+import heapq
+import json
+import mmap
+import os
+import struct
+
+from snapshot import source_stamp
+
+LANDMARKS_FILE = "degrees.landmarks"
+DEFAULT_LANDMARKS = 16
+
+MAGIC = b"DEGLMK01"
+PREAMBLE = struct.Struct("<8sQ")
+
+# Distances are stored one byte each; this marks "not reachable"
+UNREACHED = 255
+
+
+class LandmarkIndex():
+    """
+    BFS distances from K landmark people to every person, stored
+    person-major (K bytes per person) so one slice gives a person's row.
+    Distances past 254 are clipped, which only weakens the bounds.
+
+    For any landmark L, |d(L, v) - d(L, t)| <= d(v, t), which gives the
+    admissible, consistent A* heuristic used by shortest_path.
+    """
+
+    def __init__(self, graph, landmarks, distances):
+        self.graph = graph
+        self.landmarks = landmarks
+        self.k = len(landmarks)
+        self.distances = distances
+
+    @classmethod
+    def build(cls, graph, k=DEFAULT_LANDMARKS):
+        """
+        Picks the `k` people with the most co-star links as landmarks and
+        runs a BFS from each of them.
+        """
+        k = min(k, graph.num_people)
+        degree = [
+            sum(len(graph.stars_of(m)) for m in graph.movies_of(p))
+            for p in range(graph.num_people)
+        ]
+        landmarks = sorted(
+            range(graph.num_people), key=lambda p: degree[p], reverse=True
+        )[:k]
+
+        distances = bytearray(k * graph.num_people)
+        for i, landmark in enumerate(landmarks):
+            distances[i::k] = bytes(
+                UNREACHED if d < 0 else min(d, UNREACHED - 1)
+                for d in graph.distances(landmark)
+            )
+        return cls(graph, landmarks, distances)
+
+    def row(self, person):
+        return self.distances[person * self.k:(person + 1) * self.k]
+
+    def lower_bound(self, person, target_row):
+        """
+        Returns a lower bound on the degrees of separation between
+        `person` and the target whose row is `target_row`, or None if a
+        landmark proves they are in different components.
+        """
+        best = 0
+        for a, b in zip(self.row(person), target_row):
+            if a == UNREACHED or b == UNREACHED:
+                if a != b:
+                    return None
+                continue
+            d = a - b if a > b else b - a
+            if d > best:
+                best = d
+        return best
+
+    def shortest_path(self, source, target):
+        """
+        A* search between two person indexes, guided by the landmark
+        bounds. Returns the (movie_id, person_id) path or None.
+        """
+        graph = self.graph
+        if source == target:
+            return []
+        target_row = self.row(target)
+        h = self.lower_bound(source, target_row)
+        if h is None:
+            return None
+
+        depth = {source: 0}
+        parents = {}
+        # Ties on f go to the deeper node, which heads toward the target
+        heap = [(h, 0, source)]
+        while heap:
+            _, d, person = heapq.heappop(heap)
+            d = -d
+            if person == target:
+                return self._path(parents, source, target)
+            if d > depth[person]:
+                continue
+            graph.expanded += 1
+            d += 1
+            for movie in graph.movies_of(person):
+                for star in graph.stars_of(movie):
+                    if depth.get(star, d + 1) <= d:
+                        continue
+                    h = self.lower_bound(star, target_row)
+                    if h is None:
+                        continue
+                    depth[star] = d
+                    parents[star] = (movie, person)
+                    heapq.heappush(heap, (d + h, -d, star))
+
+        return None
+
+    def _path(self, parents, source, target):
+        graph = self.graph
+        path = []
+        person = target
+        while person != source:
+            movie, parent = parents[person]
+            path.append((graph.movie_ids[movie], graph.person_ids[person]))
+            person = parent
+        path.reverse()
+        return path
+
+
+def load_index(directory, graph, k=DEFAULT_LANDMARKS, rebuild=False):
+    """
+    Returns the landmark index for `directory`, reading the persisted one
+    when it was built from the current CSVs with the same `k`, and
+    building and saving it otherwise.
+    """
+    path = os.path.join(directory, LANDMARKS_FILE)
+    stamp = source_stamp(directory)
+    if not rebuild:
+        index = read_index(path, graph, stamp, k)
+        if index is not None:
+            return index
+
+    index = LandmarkIndex.build(graph, k)
+    try:
+        write_index(index, path, stamp)
+    except OSError:
+        pass
+    return index
+
+
+def write_index(index, path, stamp):
+    graph = index.graph
+    header = json.dumps({
+        "stamp": stamp,
+        "landmarks": [graph.person_ids[p] for p in index.landmarks],
+    }).encode("utf-8")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, len(header)))
+        f.write(header)
+        f.write(index.distances)
+    os.replace(tmp, path)
+
+
+def read_index(path, graph, stamp, k):
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, header_size = PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC:
+            return None
+        header = json.loads(
+            buffer[PREAMBLE.size:PREAMBLE.size + header_size].decode("utf-8")
+        )
+    except (struct.error, ValueError):
+        return None
+    landmarks = [graph.person_index(p) for p in header["landmarks"]]
+    if header["stamp"] != stamp or len(landmarks) != min(k, graph.num_people):
+        return None
+
+    start = PREAMBLE.size + header_size
+    distances = memoryview(buffer)[start:start + len(landmarks) * graph.num_people]
+    return LandmarkIndex(graph, landmarks, distances)
@@ -0,0 +1,206 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+# Typo tolerance of search(), in edits (insert, delete or substitute)
+MAX_EDITS = 2
+
+# Trigrams search() counts beyond the minimum needed for its guarantee;
+# each one raises the number of trigrams a candidate must share
+PROBE_SLACK = 3
+
+# Most names a prefix() call scans before ranking, so that very short
+# prefixes stay cheap
+PREFIX_SCAN = 5000
+
+
+class NameIndex():
+    """
+    Index over people's lowercase names for exact, prefix and
+    typo-tolerant lookup.
+
+    Distinct names are numbered in insertion order and also kept in a
+    sorted array, so exact and prefix lookups are a binary search, plus a
+    trigram -> name number postings map for fuzzy search. People sharing
+    a name are ordered most-connected first, by the `connections`
+    function given to the constructor.
+    """
+
+    def __init__(self, entries, connections):
+        """
+        `entries` yields (person_id, name) pairs; `connections(person_id)`
+        returns how well connected a person is, used to rank matches.
+        """
+        by_name = {}
+        for person_id, name in entries:
+            by_name.setdefault(name.lower(), []).append(person_id)
+
+        self.connections = connections
+        self.keys = sorted(by_name)
+        self.people = [by_name[key] for key in self.keys]
+        for person_ids in self.people:
+            if len(person_ids) > 1:
+                person_ids.sort(key=connections, reverse=True)
+        del by_name
+
+        # Names are numbered in sorted order to begin with; names added
+        # later get the next number and are spliced into sorted_keys
+        self.sorted_keys = list(self.keys)
+        self.sorted_numbers = array("i", range(len(self.keys)))
+
+        self.grams = {}
+        for i, key in enumerate(self.keys):
+            self._index_grams(i, key)
+
+    def add(self, person_id, name):
+        """
+        Adds a person, e.g. from an appended people.csv row.
+        """
+        key = name.lower()
+        i = self._find(key)
+        if i is None:
+            i = len(self.keys)
+            self.keys.append(key)
+            self.people.append([person_id])
+            position = bisect_left(self.sorted_keys, key)
+            self.sorted_keys.insert(position, key)
+            self.sorted_numbers.insert(position, i)
+            self._index_grams(i, key)
+        elif person_id not in self.people[i]:
+            self.people[i].append(person_id)
+            self.reorder(name)
+
+    def remove(self, person_id, name):
+        """
+        Removes a person from `name`, e.g. after they were renamed. The
+        name stays indexed, matching nobody until someone has it again.
+        """
+        i = self._find(name.lower())
+        if i is not None and person_id in self.people[i]:
+            self.people[i].remove(person_id)
+
+    def reorder(self, name):
+        """
+        Re-ranks the people sharing `name`, after one of them starred in
+        more movies.
+        """
+        i = self._find(name.lower())
+        if i is not None and len(self.people[i]) > 1:
+            self.people[i].sort(key=self.connections, reverse=True)
+
+    def exact(self, name):
+        """
+        Returns the ids of people named `name`, most-connected first.
+        """
+        i = self._find(name.lower())
+        return [] if i is None else list(self.people[i])
+
+    def prefix(self, prefix, limit=10):
+        """
+        Returns up to `limit` ids of people whose name starts with
+        `prefix`, most-connected first.
+        """
+        prefix = prefix.lower()
+        keys = self.sorted_keys
+        i = bisect_left(keys, prefix)
+        end = min(len(keys), i + PREFIX_SCAN)
+        matches = []
+        while i < end and keys[i].startswith(prefix):
+            matches.extend(self.people[self.sorted_numbers[i]])
+            i += 1
+        matches.sort(key=self.connections, reverse=True)
+        return matches[:limit]
+
+    def search(self, query, limit=10, max_edits=MAX_EDITS):
+        """
+        Returns up to `limit` ids of people whose name is within
+        `max_edits` of `query` or starts with it, best match first:
+        by edit distance, then exact prefix, then connectedness.
+        """
+        query = query.lower()
+        grams = sorted(
+            set(trigrams(query)), key=lambda g: len(self.grams.get(g, ()))
+        )
+        # Each edit destroys at most three of the query's trigrams, so a
+        # name within max_edits shares at least m - 3k of any m of them.
+        # Counting hits over only the rarest few keeps this cheap while
+        # still requiring several shared trigrams per candidate
+        probe = grams[:3 * max_edits + PROBE_SLACK]
+        need = max(1, len(probe) - 3 * max_edits)
+        hits = Counter()
+        for gram in probe:
+            hits.update(self.grams.get(gram, ()))
+
+        ranked = []
+        for i, count in hits.items():
+            if count < need:
+                continue
+            key = self.keys[i]
+            distance = edit_distance(query, key, max_edits)
+            if distance is None:
+                continue
+            for person_id in self.people[i]:
+                ranked.append((distance, person_id))
+
+        seen = {person_id for _, person_id in ranked}
+        for person_id in self.prefix(query, limit):
+            if person_id not in seen:
+                # Rank completions after every name within one edit
+                ranked.append((1.5, person_id))
+
+        ranked.sort(key=lambda r: (r[0], -self.connections(r[1])))
+        return [person_id for _, person_id in ranked[:limit]]
+
+    def _find(self, key):
+        keys = self.sorted_keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return self.sorted_numbers[i]
+        return None
+
+    def _index_grams(self, i, key):
+        for gram in set(trigrams(key)):
+            postings = self.grams.get(gram)
+            if postings is None:
+                postings = self.grams[gram] = array("i")
+            postings.append(i)
+
+
+def trigrams(s):
+    """
+    Returns the trigrams of `s` padded so that its first and last
+    characters appear in as many trigrams as the rest.
+    """
+    s = f"  {s}  "
+    return [s[i:i + 3] for i in range(len(s) - 2)]
+
+
+def edit_distance(a, b, limit):
+    """
+    Levenshtein distance between `a` and `b`, or None if it exceeds `limit`.
+    Only the diagonal band of width 2 * limit + 1 is computed.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return None
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        ca = a[i - 1]
+        best = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            d = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != b[j - 1]),
+                over,
+            )
+            current[j] = d
+            if d < best:
+                best = d
+        if best > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
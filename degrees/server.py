@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs, urlsplit
+
+import degrees
+
+# How many recent request latencies /stats computes percentiles over
+LATENCY_WINDOW = 10000
+
+
+class PathCache():
+    """
+    Bounded LRU cache of shortest_path results keyed on (source, target,
+    mode), as each search mode may find a different path.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def invalidate(self, touched):
+        """
+        Drops the cached results a graph update touching the people in
+        `touched` (as returned by degrees.apply_updates) could change,
+        and returns how many were dropped.
+
+        Any new path must cross from one touched person a to another b,
+        so (source, target) can only get closer if
+        d(source, a) + 1 + d(b, target) beats the cached length.
+        """
+        if not touched or not self.entries:
+            return 0
+        lengths = [len(p) for p in self.entries.values() if p is not None]
+        if len(lengths) < len(self.entries):
+            max_depth = None
+        else:
+            max_depth = max(lengths) - 2
+        distance = degrees.separation_from(touched, max_depth)
+
+        stale = []
+        for (source, target, mode), path in self.entries.items():
+            ds, dt = distance.get(source), distance.get(target)
+            if ds is None or dt is None:
+                continue
+            if path is None or ds + dt + 1 < len(path):
+                stale.append((source, target, mode))
+        for key in stale:
+            del self.entries[key]
+        return len(stale)
+
+
+class Stats():
+    """
+    Request counters and a window of recent latencies per endpoint.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = {}
+        self.errors = 0
+        self.latencies = {}
+
+    def record(self, endpoint, seconds, ok):
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if not ok:
+            self.errors += 1
+        window = self.latencies.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW))
+        window.append(seconds)
+
+    def report(self, cache):
+        uptime = time.monotonic() - self.started
+        total = sum(self.requests.values())
+        endpoints = {}
+        for endpoint, count in self.requests.items():
+            window = sorted(self.latencies[endpoint])
+            endpoints[endpoint] = {
+                "requests": count,
+                "p50_ms": _percentile(window, 0.50) * 1000,
+                "p99_ms": _percentile(window, 0.99) * 1000,
+                "max_ms": window[-1] * 1000,
+            }
+        return {
+            "uptime_s": uptime,
+            "requests": total,
+            "errors": self.errors,
+            "throughput_rps": total / uptime if uptime else 0,
+            "endpoints": endpoints,
+            "cache": {
+                "size": len(cache.entries),
+                "capacity": cache.size,
+                "hits": cache.hits,
+                "misses": cache.misses,
+            },
+        }
+
+
+class DegreesServer():
+    """
+    Answers shortest-path and name-lookup requests over HTTP against the
+    graph loaded once into the degrees module.
+
+        GET /path?source=...&target=...[&mode=...]
+        GET /person?name=...
+        GET /search?q=...[&limit=...][&prefix=1]
+        GET /stats
+        POST /update?directory=...
+
+    Updates wait for in-flight searches to finish and hold new ones
+    back while they modify the graph.
+    """
+
+    def __init__(self, mode="flattened", cache_size=4096):
+        self.mode = mode
+        self.cache = PathCache(cache_size)
+        self.stats = Stats()
+        self.routes = {
+            "/path": self.handle_path,
+            "/person": self.handle_person,
+            "/search": self.handle_search,
+            "/stats": self.handle_stats,
+            "/update": self.handle_update,
+        }
+        self.searches = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.update_lock = asyncio.Lock()
+
+    async def handle_path(self, query):
+        source = degrees.resolve_person(_param(query, "source"))
+        target = degrees.resolve_person(_param(query, "target"))
+        if source is None or target is None:
+            raise LookupError("person not found")
+        mode = query.get("mode", [self.mode])[0]
+        if mode not in degrees.SEARCH_MODES:
+            raise ValueError(f"unknown search mode: {mode}")
+
+        key = (source, target, mode)
+        try:
+            path = self.cache.get(key)
+            cached = True
+        except KeyError:
+            # Searches are CPU-bound; run them off the event loop so
+            # lookups and stats stay responsive meanwhile
+            async with self.update_lock:
+                self.searches += 1
+                self.idle.clear()
+            try:
+                path = await asyncio.get_running_loop().run_in_executor(
+                    None, degrees.shortest_path, source, target, mode
+                )
+            finally:
+                self.searches -= 1
+                if not self.searches:
+                    self.idle.set()
+            self.cache.put(key, path)
+            cached = False
+
+        return {
+            "source": source,
+            "target": target,
+            "degrees": None if path is None else len(path),
+            "path": path,
+            "cached": cached,
+        }
+
+    async def handle_person(self, query):
+        name = _param(query, "name")
+        return {
+            "name": name,
+            "matches": _people(degrees.name_index.exact(name)),
+        }
+
+    async def handle_search(self, query):
+        q = _param(query, "q")
+        limit = int(query.get("limit", ["10"])[0])
+        if query.get("prefix", ["0"])[0] not in ("", "0"):
+            person_ids = degrees.name_index.prefix(q, limit)
+        else:
+            person_ids = degrees.name_index.search(q, limit)
+        return {"q": q, "matches": _people(person_ids)}
+
+    async def handle_stats(self, query):
+        return self.stats.report(self.cache)
+
+    async def handle_update(self, query):
+        directory = _param(query, "directory")
+        async with self.update_lock:
+            await self.idle.wait()
+            touched = degrees.load_updates(directory)
+            dropped = self.cache.invalidate(touched)
+        return {"touched_people": len(touched), "invalidated": dropped}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Headers are read and ignored; every route is a bodiless GET
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            writer.close()
+            return
+
+        start = time.perf_counter()
+        endpoint = None
+        try:
+            method, target, _version = request_line.decode("latin-1").split()
+            url = urlsplit(target)
+            endpoint = url.path
+            handler = self.routes.get(endpoint)
+            expected = "POST" if endpoint == "/update" else "GET"
+            if handler is None:
+                status, body = 404, {"error": f"no such endpoint: {endpoint}"}
+            elif method != expected:
+                status, body = 405, {"error": f"{endpoint} expects {expected}"}
+            else:
+                status, body = 200, await handler(parse_qs(url.query))
+        except FileNotFoundError as e:
+            status, body = 404, {"error": f"{e.strerror}: {e.filename}"}
+        except LookupError as e:
+            status, body = 404, {"error": str(e.args[0])}
+        except ValueError as e:
+            status, body = 400, {"error": str(e)}
+
+        if endpoint in self.routes:
+            self.stats.record(endpoint, time.perf_counter() - start, status == 200)
+
+        payload = json.dumps(body).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8050, unix=None):
+        if unix is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, unix)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed"}
+
+
+def main():
+    parser = argparse.ArgumentParser(usage="python server.py [directory]")
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--unix", metavar="PATH",
+                        help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--compact", action="store_true",
+                        help="use the integer-indexed CSR graph")
+    parser.add_argument("--mode", choices=degrees.SEARCH_MODES,
+                        default="flattened",
+                        help="default search strategy for /path")
+    parser.add_argument("--landmarks", type=int, metavar="K", default=0,
+                        help="load a landmark index for astar searches")
+    parser.add_argument("--cache-size", type=int, default=4096,
+                        help="number of paths kept in the LRU cache")
+    args = parser.parse_args()
+    if args.mode == "astar" and not args.landmarks:
+        args.landmarks = degrees.landmarks.DEFAULT_LANDMARKS
+    if args.landmarks:
+        args.compact = True
+
+    print("Loading data...", file=sys.stderr)
+    degrees.load_data(args.directory, compact=args.compact,
+                      num_landmarks=args.landmarks, index_names=True)
+    print("Data loaded.", file=sys.stderr)
+
+    server = DegreesServer(mode=args.mode, cache_size=args.cache_size)
+    where = args.unix or f"http://{args.host}:{args.port}"
+    print(f"Serving on {where}", file=sys.stderr)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+def _param(query, name):
+    try:
+        return query[name][0]
+    except KeyError:
+        raise ValueError(f"missing parameter: {name}") from None
+
+
+def _people(person_ids):
+    return [
+        {
+            "id": person_id,
+            "name": degrees.person_name(person_id),
+            "birth": degrees.person_birth(person_id),
+            "movies": degrees.connections(person_id),
+        }
+        for person_id in person_ids
+    ]
+
+
+def _percentile(window, q):
+    return window[min(len(window) - 1, int(q * len(window)))]
+
+
+if __name__ == "__main__":
+    main()
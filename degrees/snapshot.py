@@ -0,0 +1,170 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+
+from compact import CompactGraph, INDEX_TYPECODE
+
+SNAPSHOT_FILE = "degrees.snapshot"
+SOURCE_FILES = ("people.csv", "movies.csv", "stars.csv")
+
+MAGIC = b"DEGSNAP1"
+# Magic followed by the byte length of the JSON header
+PREAMBLE = struct.Struct("<8sQ")
+ALIGN = 8
+
+INDEX_SECTIONS = (
+    "person_offsets", "person_movies",
+    "movie_offsets", "movie_people",
+    "name_order",
+)
+STRING_SECTIONS = (
+    "person_ids", "person_names", "person_births",
+    "movie_ids", "movie_titles", "movie_years",
+)
+
+
+class StringTable():
+    """
+    Read-only sequence of strings stored as a UTF-8 blob plus an offsets
+    array, decoded lazily on access.
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("string table index out of range")
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+
+def source_stamp(directory):
+    """
+    Returns the (size, mtime) of each source CSV, used to tell whether
+    files derived from them are still current.
+    """
+    stamp = {}
+    for filename in SOURCE_FILES:
+        st = os.stat(os.path.join(directory, filename))
+        stamp[filename] = [st.st_size, st.st_mtime_ns]
+    return stamp
+
+
+def load_graph(directory, rebuild=False):
+    """
+    Returns a CompactGraph for `directory`, memory-mapping its snapshot
+    when one exists for the current CSVs and (re)writing it otherwise.
+    """
+    path = os.path.join(directory, SNAPSHOT_FILE)
+    stamp = source_stamp(directory)
+    if not rebuild:
+        graph = read_snapshot(path, stamp)
+        if graph is not None:
+            return graph
+
+    graph = CompactGraph.from_csv(directory)
+    try:
+        write_snapshot(graph, path, stamp)
+    except OSError:
+        # A read-only dataset directory just means no cache next time
+        pass
+    return graph
+
+
+def write_snapshot(graph, path, stamp):
+    """
+    Writes `graph` to `path` as a snapshot tagged with the source `stamp`.
+    """
+    sections = []
+    for name in INDEX_SECTIONS:
+        sections.append((name, INDEX_TYPECODE, _as_array(getattr(graph, name))))
+    for name in STRING_SECTIONS:
+        offsets, blob = _encode_strings(getattr(graph, name))
+        sections.append((name + ".offsets", "q", offsets))
+        sections.append((name + ".blob", "B", blob))
+
+    # Lay the sections out after the header, each aligned for its cast
+    layout = {}
+    position = 0
+    for name, typecode, data in sections:
+        position = _align(position)
+        layout[name] = [position, len(data) * data.itemsize, typecode]
+        position += len(data) * data.itemsize
+
+    header = json.dumps({"stamp": stamp, "sections": layout}).encode("utf-8")
+    base = _align(PREAMBLE.size + len(header))
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, len(header)))
+        f.write(header)
+        for name, _typecode, data in sections:
+            f.seek(base + layout[name][0])
+            data.tofile(f)
+        f.truncate(base + position)
+    os.replace(tmp, path)
+
+
+def read_snapshot(path, stamp):
+    """
+    Memory-maps the snapshot at `path` and returns a CompactGraph over it,
+    or None if it is missing, unreadable or was built from other CSVs.
+    """
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, header_size = PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC:
+            return None
+        header = json.loads(
+            buffer[PREAMBLE.size:PREAMBLE.size + header_size].decode("utf-8")
+        )
+    except (struct.error, ValueError):
+        return None
+    if header["stamp"] != stamp:
+        return None
+
+    base = _align(PREAMBLE.size + header_size)
+    view = memoryview(buffer)
+
+    def section(name):
+        offset, size, typecode = header["sections"][name]
+        return view[base + offset:base + offset + size].cast(typecode)
+
+    fields = {name: section(name) for name in INDEX_SECTIONS}
+    for name in STRING_SECTIONS:
+        fields[name] = StringTable(
+            section(name + ".offsets"), section(name + ".blob")
+        )
+    return CompactGraph(**fields)
+
+
+def _encode_strings(strings):
+    offsets = array("q", [0])
+    blob = bytearray()
+    for s in strings:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, array("B", blob)
+
+
+def _as_array(values):
+    if isinstance(values, array):
+        return values
+    return array(INDEX_TYPECODE, values)
+
+
+def _align(position):
+    return (position + ALIGN - 1) // ALIGN * ALIGN
@@ -1,3 +1,6 @@
+from collections import deque
+
+
 class Node():
     def __init__(self, state, parent, action):
         self.state = state
@@ -7,17 +10,22 @@ class Node():
 
 class StackFrontier():
     def __init__(self):
-        self.frontier = []
+        self.frontier = deque()
+        # Count of queued nodes per state, so contains_state is O(1).
+        # Plain values (not Nodes) are their own state.
+        self.states = {}
 
     def add(self, node):
         self.frontier.append(node)
+        state = _state(node)
+        self.states[state] = self.states.get(state, 0) + 1
 
     def addMany(self, nodes):
         for node in nodes:
             self.add(node)
 
     def contains_state(self, state):
-        return any(node.state == state for node in self.frontier)
+        return state in self.states
 
     def empty(self):
         return len(self.frontier) == 0
@@ -26,10 +34,18 @@ class StackFrontier():
         if self.empty():
             raise Exception("empty frontier")
         else:
-            node = self.frontier[-1]
-            self.frontier = self.frontier[:-1]
+            node = self.frontier.pop()
+            self._forget(node)
             return node
 
+    def _forget(self, node):
+        state = _state(node)
+        count = self.states[state] - 1
+        if count:
+            self.states[state] = count
+        else:
+            del self.states[state]
+
 
 class QueueFrontier(StackFrontier):
 
@@ -37,6 +53,10 @@ class QueueFrontier(StackFrontier):
         if self.empty():
             raise Exception("empty frontier")
         else:
-            node = self.frontier[0]
-            self.frontier = self.frontier[1:]
+            node = self.frontier.popleft()
+            self._forget(node)
             return node
+
+
+def _state(node):
+    return node.state if isinstance(node, Node) else node
@@ -0,0 +1,169 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import heredity
+
+FIELDS = ("family", "person", "gene_2", "gene_1", "gene_0", "trait")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python batch.py PATH [PATH ...] [--method METHOD] "
+              "[--format {csv,jsonl}] [--processes N]")
+    parser.add_argument("paths", nargs="+", metavar="PATH",
+                        help="family CSV, directory of them or glob")
+    parser.add_argument("--method", choices=heredity.METHODS,
+                        default="eliminate")
+    parser.add_argument("--samples", type=int)
+    parser.add_argument("--seconds", type=float,
+                        help="time budget per family for sampling")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    parser.add_argument("--output", metavar="FILE",
+                        help="file for the marginals (standard output by "
+                             "default)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    families, missing = family_files(args.paths)
+
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = _writer(output, args.format)
+        results = [
+            {"family": path, "people": 0, "seconds": 0.0, "error": error}
+            for path, error in missing
+        ]
+        for result in run(families, args.method, args.samples, args.seconds,
+                          args.seed, args.processes):
+            if result["error"] is None:
+                for row in result["rows"]:
+                    writer(row)
+                output.flush()
+            del result["rows"]
+            results.append(result)
+    finally:
+        if args.output:
+            output.close()
+
+    print_summary(results, file=sys.stderr)
+    if any(result["error"] is not None for result in results):
+        sys.exit(1)
+
+
+def family_files(paths):
+    """
+    Returns (families, missing): the family CSVs named by `paths`, each
+    a file, a directory whose .csv files are all families, or a glob,
+    sorted and without repeats; and (path, reason) for each path that
+    names no file, or glob that matches none.
+    """
+    files = set()
+    missing = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, "*.csv"))
+        elif os.path.exists(path):
+            matches = [path]
+        elif any(c in path for c in "*?["):
+            matches = glob.glob(path, recursive=True)
+            if not matches:
+                missing.append((path, "no files match this pattern"))
+        else:
+            missing.append((path, "no such file or directory"))
+            continue
+        files.update(match for match in matches if os.path.isfile(match))
+    return sorted(files), missing
+
+
+def run(families, method="eliminate", samples=None, seconds=None, seed=None,
+        processes=None):
+    """
+    Infers every family in `families` on a process pool, yielding each
+    family's result as soon as it is done: its "family" file, "people",
+    "seconds" taken, "error" (None unless it failed) and marginal "rows"
+    of FIELDS.
+    """
+    tasks = [(family, method, samples, seconds, seed) for family in families]
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap_unordered(_infer_family, tasks)
+
+
+def print_summary(results, file=sys.stdout):
+    """
+    Prints each family's time, slowest first, then the failures and
+    totals.
+    """
+    results = sorted(results, key=lambda result: -result["seconds"])
+    failed = [result for result in results if result["error"] is not None]
+    print("Seconds  People  Family", file=file)
+    for result in results:
+        status = "" if result["error"] is None else "  (failed)"
+        print(f"{result['seconds']:7.3f}  {result['people']:6}  "
+              f"{result['family']}{status}", file=file)
+    for result in failed:
+        print(f"Failed {result['family']}: {result['error']}", file=file)
+    total = sum(result["seconds"] for result in results)
+    print(f"{len(results) - len(failed)} of {len(results)} families in "
+          f"{total:.2f}s of inference", file=file)
+
+
+def check_parents(people):
+    """
+    Raises ValueError unless everyone in `people` has both parents or
+    neither, all of them in `people`.
+    """
+    for person in people:
+        parents = (people[person]["mother"], people[person]["father"])
+        if (parents[0] is None) != (parents[1] is None):
+            raise ValueError(f"{person} has only one parent given")
+        for parent in parents:
+            if parent is not None and parent not in people:
+                raise ValueError(f"{person}'s parent {parent} is not in the file")
+
+
+def _infer_family(task):
+    family, method, samples, seconds, seed = task
+    started = time.perf_counter()
+    result = {"family": family, "people": 0, "error": None, "rows": []}
+    try:
+        people = heredity.load_data(family)
+        result["people"] = len(people)
+        check_parents(people)
+        probabilities = heredity.infer(people, method, samples, seconds, seed)
+    except Exception as e:
+        # One bad family must not take the rest of the batch down with it
+        result["error"] = f"{type(e).__name__}: {e}"
+    else:
+        for person in people:
+            gene = probabilities[person]["gene"]
+            result["rows"].append({
+                "family": family,
+                "person": person,
+                "gene_2": gene[2],
+                "gene_1": gene[1],
+                "gene_0": gene[0],
+                "trait": probabilities[person]["trait"][True],
+            })
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def _writer(output, format):
+    if format == "jsonl":
+        def write(row):
+            output.write(json.dumps(row) + "\n")
+        return write
+    writer = csv.DictWriter(output, FIELDS)
+    writer.writeheader()
+    return writer.writerow
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
+import argparse
 import csv
 import itertools
 import sys
 import math
 
+import numpy as np
+
+import inference
+import sampling
+
 PROBS = {
 
     # Unconditional probabilities for having gene
@@ -37,14 +43,95 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Ways main can compute the probabilities; "enumerate" sums the joint
+# probability of every gene and trait assignment, and "vectorized" does
+# the same with NumPy, while "likelihood" and "gibbs" estimate them by
+# sampling
+METHODS = ("eliminate", "enumerate", "vectorized", "likelihood", "gibbs")
+SAMPLING_METHODS = ("likelihood", "gibbs")
+
+# Samples the sampling methods draw unless given a count or time budget
+SAMPLES = 1000000
+
+# Configurations vectorized_probabilities evaluates at once
+BATCH_SIZE = 1 << 16
+
+# Most people vectorized_probabilities enumerates, with up to
+# 3 ** 10 * 2 ** 10 configurations; larger families need "eliminate"
+MAX_VECTORIZED_PEOPLE = 10
+
 
 def main():
 
     # Check for proper usage
-    # if len(sys.argv) != 2:
-    #     sys.exit("Usage: python heredity.py data.csv")
-    # people = load_data(sys.argv[1])
-    people = load_data("data/family0.csv")
+    parser = argparse.ArgumentParser(
+        usage="python heredity.py [data.csv] [--method METHOD] "
+              "[--samples N] [--seconds T]")
+    parser.add_argument("data", nargs="?", default="data/family0.csv")
+    parser.add_argument("--method", choices=METHODS, default="eliminate")
+    parser.add_argument("--samples", type=int,
+                        help=f"samples to draw with {' or '.join(SAMPLING_METHODS)} "
+                             f"(default {SAMPLES}, or unlimited with --seconds)")
+    parser.add_argument("--seconds", type=float,
+                        help="time budget for sampling")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    people = load_data(args.data)
+
+    report = {}
+    try:
+        probabilities = infer(people, args.method, args.samples, args.seconds,
+                              args.seed, report)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    # Print results
+    for person in people:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                print(f"    {value}: {p:.4f}")
+    if report:
+        print(f"{report['samples']} samples in {report['seconds']:.2f}s, "
+              f"effective sample size {report['ess']:.0f}")
+
+
+def infer(people, method="eliminate", samples=None, seconds=None, seed=None,
+          report=None):
+    """
+    Return each person's gene and trait probability distributions given
+    the known traits, computed by one of METHODS.
+
+    The sampling methods draw `samples` samples, or as many as they can
+    in `seconds`, and fill in `report`, if given, with the number drawn,
+    the time taken and their effective sample size.
+    """
+    if method in SAMPLING_METHODS:
+        if samples is None and seconds is None:
+            samples = SAMPLES
+        sample = (sampling.likelihood_weighting if method == "likelihood"
+                  else sampling.gibbs_sampling)
+        probabilities, stats = sample(people, PROBS, samples, seconds, seed)
+        if report is not None:
+            report.update(stats)
+        return probabilities
+    if method == "eliminate":
+        return inference.JunctionTree(people, PROBS).marginals()
+    if method == "enumerate":
+        return enumerate_probabilities(people)
+    if method == "vectorized":
+        return vectorized_probabilities(people)
+    raise ValueError(f"unknown method: {method}")
+
+
+def enumerate_probabilities(people):
+    """
+    Return each person's gene and trait probability distributions by
+    summing the joint probability of every assignment of genes and
+    traits consistent with the known traits.
+    """
 
     # Keep track of gene and trait probabilities for each person
     probabilities = {
@@ -85,15 +172,70 @@ def main():
 
     # Ensure probabilities sum to 1
     normalize(probabilities)
+    return probabilities
 
-    # Print results
-    for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+
+def vectorized_probabilities(people):
+    """
+    Return the same distributions as `enumerate_probabilities`, with the
+    configurations numbered and decoded into arrays a batch at a time,
+    and their joint probabilities and the marginal sums computed with
+    NumPy rather than per configuration. Raises ValueError for families
+    of more than MAX_VECTORIZED_PEOPLE people or with someone who is
+    their own ancestor.
+    """
+    inference.parents_first(people)
+    names = list(people)
+    n = len(names)
+    if n > MAX_VECTORIZED_PEOPLE:
+        raise ValueError(
+            f"family has {n} people, more than the {MAX_VECTORIZED_PEOPLE} "
+            f"vectorized enumeration allows"
+        )
+    unknown = [i for i, person in enumerate(names)
+               if people[person]["trait"] is None]
+    known = np.array([bool(people[person]["trait"]) for person in names],
+                     dtype=bool)
+
+    # Configuration c has person i's gene count as base-3 digit i of c,
+    # and the unknown traits as bits above those
+    total = 3 ** n * 2 ** len(unknown)
+    tables = joint_tables(people)
+    gene_sums = np.zeros(3 * n)
+    trait_sums = np.zeros(2 * n)
+    for start in range(0, total, BATCH_SIZE):
+        code = np.arange(start, min(total, start + BATCH_SIZE))
+        genes = np.empty((len(code), n), dtype=np.intp)
+        for i in range(n):
+            code, genes[:, i] = np.divmod(code, 3)
+        traits = np.repeat(known[None, :], len(genes), axis=0)
+        for i in unknown:
+            code, bit = np.divmod(code, 2)
+            traits[:, i] = bit
+
+        p = joint_probabilities(people, genes, traits, tables)
+        weights = np.repeat(p, n)
+        gene_sums += np.bincount((genes + 3 * np.arange(n)).ravel(),
+                                 weights=weights, minlength=3 * n)
+        trait_sums += np.bincount((traits + 2 * np.arange(n)).ravel(),
+                                  weights=weights, minlength=2 * n)
+
+    probabilities = {
+        person: {
+            "gene": {
+                2: float(gene_sums[3 * i + 2]),
+                1: float(gene_sums[3 * i + 1]),
+                0: float(gene_sums[3 * i])
+            },
+            "trait": {
+                True: float(trait_sums[2 * i + 1]),
+                False: float(trait_sums[2 * i])
+            }
+        }
+        for i, person in enumerate(names)
+    }
+    normalize(probabilities)
+    return probabilities
 
 
 def load_data(filename):
@@ -162,8 +304,8 @@ def joint_probability(people: dict, one_gene: set, two_genes: set, have_trait):
 
             mom_gene = get_gene(person_mom)
             dad_gene = get_gene(person_dad)
-            mother_pass = 1 - mutation if mom_gene == 2 else 0.5 if mom_gene is 1 else mutation
-            father_pass = 1 - mutation if dad_gene == 2 else 0.5 if mom_gene is 1 else mutation
+            mother_pass = 1 - mutation if mom_gene == 2 else 0.5 if mom_gene == 1 else mutation
+            father_pass = 1 - mutation if dad_gene == 2 else 0.5 if dad_gene == 1 else mutation
             person_gene_probs = 1
             # probability of both mom and dad
             if person_gene == 2:
@@ -185,6 +327,61 @@ def joint_probability(people: dict, one_gene: set, two_genes: set, have_trait):
     prob = math.prod(probs)
     return prob
 
+def joint_probabilities(people, genes, traits, tables=None):
+    """
+    Compute the joint probability of many configurations at once.
+
+    Row c of `genes` holds each person's number of gene copies and row
+    c of `traits` whether they have the trait, with columns in the order
+    of `people`. Returns an array of the joint probability of each row,
+    as `joint_probability` would compute it. `tables` is the result of
+    `joint_tables(people)`, built here if not given.
+    """
+    if tables is None:
+        tables = joint_tables(people)
+    founders, mothers, fathers, children = tables["people"]
+    p = tables["prior"][genes[:, founders]].prod(axis=1)
+    p *= tables["inheritance"][
+        genes[:, mothers], genes[:, fathers], genes[:, children]
+    ].prod(axis=1)
+    p *= tables["trait"][genes, traits.astype(np.intp)].prod(axis=1)
+    return p
+
+
+def joint_tables(people):
+    """
+    Return what `joint_probabilities` needs that does not depend on the
+    configurations: the column numbers of founders and of each child
+    and their parents, and the gene, trait and inheritance tables.
+    """
+    index = {person: i for i, person in enumerate(people)}
+    founders = []
+    children = []
+    mothers = []
+    fathers = []
+    for person in people:
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+        if mother and father:
+            children.append(index[person])
+            mothers.append(index[mother])
+            fathers.append(index[father])
+        else:
+            founders.append(index[person])
+
+    prior = np.array([PROBS["gene"][gene] for gene in range(3)])
+    trait = np.array([
+        [PROBS["trait"][gene][False], PROBS["trait"][gene][True]]
+        for gene in range(3)
+    ])
+    return {
+        "people": tuple(np.array(columns, dtype=np.intp) for columns in
+                        (founders, mothers, fathers, children)),
+        "prior": prior,
+        "trait": trait,
+        "inheritance": inference.inheritance_table(PROBS),
+    }
+
 def update(probabilities, one_gene: set, two_genes: set, have_trait: set, p):
     """
     Add to `probabilities` a new joint probability `p`.
@@ -0,0 +1,439 @@
+import heapq
+
+import numpy as np
+
+# Most people in one clique, whose table has 3 ** size entries; beyond
+# this the pedigree is too tangled for exact inference
+MAX_CLIQUE_SIZE = 14
+
+
+class Factor():
+    """
+    Table over some people's gene counts: axis i of `table` is the number
+    of copies of the gene (0, 1 or 2) that `scope[i]` has.
+    """
+
+    def __init__(self, scope, table):
+        self.scope = tuple(scope)
+        self.table = np.asarray(table, dtype=float)
+
+    def multiply(self, other):
+        scope = self.scope + tuple(p for p in other.scope if p not in self.scope)
+        axis = {person: i for i, person in enumerate(scope)}
+        table = np.einsum(
+            self.table, [axis[p] for p in self.scope],
+            other.table, [axis[p] for p in other.scope],
+            list(range(len(scope))),
+        )
+        return Factor(scope, table)
+
+    def divide(self, other):
+        """
+        Divides by a factor over a subset of this one's scope, taking
+        0 / 0 to be 0.
+        """
+        other = other.aligned(self.scope)
+        table = np.divide(self.table, other, out=np.zeros_like(self.table),
+                          where=other != 0)
+        return Factor(self.scope, table)
+
+    def marginalize(self, keep):
+        """
+        Sums out every person not in `keep`.
+        """
+        axes = tuple(i for i, p in enumerate(self.scope) if p not in keep)
+        scope = [p for p in self.scope if p in keep]
+        return Factor(scope, self.table.sum(axis=axes))
+
+    def normalized(self):
+        """
+        Returns the factor scaled to sum to 1, or unchanged if it sums to
+        0, so that long chains of products do not underflow.
+        """
+        total = self.table.sum()
+        if total > 0:
+            return Factor(self.scope, self.table / total)
+        return self
+
+    def aligned(self, scope):
+        """
+        Returns the table with axes reordered to follow `scope`, a
+        superset of this factor's, and size-1 axes for the rest, so that
+        it broadcasts against a table over `scope`.
+        """
+        order = [p for p in scope if p in self.scope]
+        table = np.transpose(self.table, [self.scope.index(p) for p in order])
+        return table.reshape([3 if p in self.scope else 1 for p in scope])
+
+
+def inheritance_table(probs):
+    """
+    Returns table[mother, father, child]: the probability of the child's
+    gene count given its parents'.
+    """
+    mutation = probs["mutation"]
+    passes = np.array([mutation, 0.5, 1 - mutation])
+    mother = passes[:, None]
+    father = passes[None, :]
+    table = np.empty((3, 3, 3))
+    table[:, :, 0] = (1 - mother) * (1 - father)
+    table[:, :, 1] = mother * (1 - father) + (1 - mother) * father
+    table[:, :, 2] = mother * father
+    return table
+
+
+def trait_likelihood(probs, trait):
+    """
+    Returns the probability of the observed `trait` for each gene count,
+    or ones if the trait is unknown.
+    """
+    if trait is None:
+        return np.ones(3)
+    return np.array([probs["trait"][gene][trait] for gene in range(3)])
+
+
+def person_factor(people, person, probs):
+    """
+    Returns the factor for `person`'s gene count given their parents',
+    times the likelihood of their known trait.
+    """
+    mother = people[person]["mother"]
+    father = people[person]["father"]
+    likelihood = trait_likelihood(probs, people[person]["trait"])
+    if mother and father:
+        return Factor((mother, father, person),
+                      inheritance_table(probs) * likelihood)
+    prior = np.array([probs["gene"][gene] for gene in range(3)])
+    return Factor((person,), prior * likelihood)
+
+
+class JunctionTree():
+    """
+    Exact inference over a pedigree by the junction tree algorithm.
+
+    People are eliminated in greedy min-fill order; eliminating a person
+    makes a clique of them and their remaining neighbours in the moral
+    graph, whose parent is the clique of the first of those neighbours
+    to be eliminated after them. Messages are passed up and then back
+    down the tree, so that every clique ends up with the joint of its
+    people and the evidence, and the cost grows with the size of the
+    largest clique (the pedigree's treewidth) rather than with the
+    number of people.
+    """
+
+    def __init__(self, people, probs):
+        self.people = people
+        self.probs = probs
+        self.factors = {
+            person: person_factor(people, person, probs) for person in people
+        }
+        self.order, self.cliques = elimination_order(
+            people, [factor.scope for factor in self.factors.values()]
+        )
+        self.width = max((len(c) for c in self.cliques.values()), default=0)
+        position = {person: i for i, person in enumerate(self.order)}
+
+        # A clique's parent is the clique of its earliest-eliminated
+        # neighbour; roots are the last cliques of each family
+        self.parent = {}
+        self.children = {person: [] for person in self.order}
+        for person in self.order:
+            separator = self.cliques[person] - {person}
+            if separator:
+                parent = min(separator, key=position.get)
+                self.parent[person] = parent
+                self.children[parent].append(person)
+
+        # Each factor goes to the clique of the first of its people to be
+        # eliminated, which contains all of them
+        self.assigned = {person: [] for person in self.order}
+        for person, factor in self.factors.items():
+            first = min(factor.scope, key=position.get)
+            self.assigned[first].append(person)
+
+        self.beliefs = None
+
+    def calibrate(self):
+        """
+        Passes messages up the tree and back down, leaving in `beliefs`
+        each clique's joint distribution with the evidence, normalized.
+        Every belief and message is rescaled to sum to 1 as it is made,
+        since the probability of the evidence itself underflows on large
+        pedigrees.
+        """
+        potentials = {person: self.potential(person) for person in self.order}
+        up = {}
+        for person in self.order:
+            belief = potentials[person]
+            for child in self.children[person]:
+                belief = belief.multiply(up[child])
+            belief = belief.normalized()
+            potentials[person] = belief
+            if person in self.parent:
+                up[person] = belief.marginalize(self.cliques[person] - {person})
+
+        self.beliefs = {}
+        for person in reversed(self.order):
+            belief = potentials[person]
+            if person in self.parent:
+                parent = self.beliefs[self.parent[person]]
+                down = parent.marginalize(self.cliques[person] - {person})
+                belief = belief.multiply(down.divide(up[person]))
+            self.beliefs[person] = belief.normalized()
+
+    def potential(self, person):
+        factor = Factor(sorted(self.cliques[person]),
+                        np.ones([3] * len(self.cliques[person])))
+        for owner in self.assigned[person]:
+            factor = factor.multiply(self.factors[owner])
+        return factor
+
+    def marginals(self):
+        """
+        Returns each person's gene and trait distributions given the
+        evidence, in the structure `heredity.main` prints.
+        """
+        if self.beliefs is None:
+            self.calibrate()
+        return {
+            person: _distribution(
+                self.probs, self.people[person]["trait"],
+                self.beliefs[person].marginalize({person}).table,
+            )
+            for person in self.people
+        }
+
+
+class Session():
+    """
+    Inference over a pedigree whose evidence changes a person at a time.
+
+    Keeps a JunctionTree's clique potentials and every message passed
+    between neighbouring cliques (in both directions, without division),
+    each normalized like JunctionTree's beliefs so that large pedigrees
+    do not underflow. Observing or retracting a person's trait only rebuilds the potential
+    of the clique holding their factor and forgets the messages leading
+    away from it, so the next query recomputes those while reusing the
+    messages from the rest of the tree and everything in other families.
+    """
+
+    def __init__(self, people, probs):
+        self.people = {person: dict(people[person]) for person in people}
+        self.probs = probs
+        self.tree = JunctionTree(self.people, probs)
+        self.neighbors = {
+            person: list(self.tree.children[person]) for person in self.tree.order
+        }
+        for child, parent in self.tree.parent.items():
+            self.neighbors[child].append(parent)
+        self.holder = {
+            owner: person
+            for person, owners in self.tree.assigned.items() for owner in owners
+        }
+        self.potentials = {
+            person: self.tree.potential(person) for person in self.tree.order
+        }
+        self.messages = {}
+        self.cache = {}
+
+    def observe(self, person, trait):
+        """
+        Sets whether `person` is known to have the trait, or with None
+        that it is unknown.
+        """
+        if trait not in (True, False, None):
+            raise ValueError(f"trait must be True, False or None: {trait!r}")
+        if self.people[person]["trait"] == trait:
+            return
+        self.people[person]["trait"] = trait
+        self.tree.factors[person] = person_factor(self.people, person, self.probs)
+        clique = self.holder[person]
+        self.potentials[clique] = self.tree.potential(clique)
+        self._invalidate(clique)
+
+    def retract(self, person):
+        """
+        Forgets whether `person` has the trait.
+        """
+        self.observe(person, None)
+
+    def marginals(self, people=None):
+        """
+        Returns the gene and trait distributions of `people` (everyone
+        by default) given the current evidence, in the structure
+        `heredity.main` prints.
+        """
+        people = list(self.people) if people is None else list(people)
+        needed = [
+            (near, person) for person in people if person not in self.cache
+            for near in self.neighbors[person]
+        ]
+        self._pass(needed)
+
+        probabilities = {}
+        for person in people:
+            if person not in self.cache:
+                self.cache[person] = _distribution(
+                    self.probs, self.people[person]["trait"],
+                    self._belief(person).marginalize({person}).table,
+                )
+            probabilities[person] = self.cache[person]
+        return probabilities
+
+    def _pass(self, edges):
+        # Computes the messages for `edges` and those they depend on,
+        # depth first with an explicit stack as pedigrees can be deep
+        stack = list(edges)
+        while stack:
+            sender, receiver = stack[-1]
+            if (sender, receiver) in self.messages:
+                stack.pop()
+                continue
+            missing = [
+                (near, sender) for near in self.neighbors[sender]
+                if near != receiver and (near, sender) not in self.messages
+            ]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            if self.tree.parent.get(sender) == receiver:
+                separator = self.tree.cliques[sender] - {sender}
+            else:
+                separator = self.tree.cliques[receiver] - {receiver}
+            belief = self._belief(sender, exclude=receiver)
+            self.messages[(sender, receiver)] = (
+                belief.marginalize(separator).normalized()
+            )
+
+    def _belief(self, clique, exclude=None):
+        belief = self.potentials[clique]
+        for near in self.neighbors[clique]:
+            if near != exclude:
+                belief = belief.multiply(self.messages[(near, clique)])
+        return belief
+
+    def _invalidate(self, clique):
+        # Every message sent away from `clique` depends on its potential,
+        # and every marginal in its family on those messages
+        self.cache.pop(clique, None)
+        stack = [(clique, None)]
+        while stack:
+            sender, came_from = stack.pop()
+            for near in self.neighbors[sender]:
+                if near != came_from:
+                    self.messages.pop((sender, near), None)
+                    self.cache.pop(near, None)
+                    stack.append((near, sender))
+
+
+def elimination_order(people, scopes, max_size=MAX_CLIQUE_SIZE):
+    """
+    Returns (order, cliques): people in greedy min-fill elimination
+    order over the moral graph of factors with the given `scopes`, and
+    for each person the set of them and their neighbours when they
+    were eliminated. Raises ValueError if a clique would have more than
+    `max_size` people, or if someone in `people` is their own ancestor.
+    """
+    parents_first(people)
+    neighbors = {person: set() for person in people}
+    for scope in scopes:
+        for person in scope:
+            neighbors[person].update(p for p in scope if p != person)
+
+    def fill(person):
+        near = list(neighbors[person])
+        return sum(
+            1 for i, a in enumerate(near) for b in near[i + 1:]
+            if b not in neighbors[a]
+        )
+
+    # Heap entries go stale as the graph changes; `scores` has the
+    # current one for each person still to be eliminated
+    scores = {}
+    heap = []
+    for person in people:
+        scores[person] = (fill(person), len(neighbors[person]))
+        heap.append((*scores[person], person))
+    heapq.heapify(heap)
+
+    order = []
+    cliques = {}
+    while heap:
+        *score, person = heapq.heappop(heap)
+        if scores.get(person) != tuple(score):
+            continue
+        del scores[person]
+        near = neighbors.pop(person)
+        if len(near) + 1 > max_size:
+            raise ValueError(
+                f"pedigree needs a clique of {len(near) + 1} people, more "
+                f"than the {max_size} exact inference allows"
+            )
+        order.append(person)
+        cliques[person] = frozenset(near | {person})
+        for a in near:
+            neighbors[a].discard(person)
+            neighbors[a].update(b for b in near if b != a)
+
+        # Fill-in only changes for the neighbours and their neighbours
+        touched = set(near)
+        for a in near:
+            touched.update(neighbors[a])
+        for a in touched:
+            scores[a] = (fill(a), len(neighbors[a]))
+            heapq.heappush(heap, (*scores[a], a))
+
+    return order, cliques
+
+
+def _distribution(probs, trait, gene):
+    # A person's distributions from the unnormalized belief in their
+    # gene count and their known trait, if any
+    total = gene.sum()
+    if not total > 0:
+        raise ValueError("the known traits are impossible in this pedigree")
+    gene = gene / total
+    if trait is None:
+        has_trait = float(gene @ trait_likelihood(probs, True))
+    else:
+        has_trait = 1.0 if trait else 0.0
+    return {
+        "gene": {2: float(gene[2]), 1: float(gene[1]), 0: float(gene[0])},
+        "trait": {True: has_trait, False: 1 - has_trait},
+    }
+
+
+def parents_first(people):
+    """
+    Returns the names in `people` ordered with everyone after their
+    parents. Raises ValueError if someone is their own ancestor.
+    """
+    order = []
+    placed = set()
+    for person in people:
+        stack = [person]
+        visiting = set()
+        while stack:
+            current = stack[-1]
+            if current in placed:
+                stack.pop()
+                continue
+            parents = [
+                parent for parent in (people[current]["mother"],
+                                      people[current]["father"])
+                if parent and parent not in placed
+            ]
+            if not parents:
+                stack.pop()
+                visiting.discard(current)
+                placed.add(current)
+                order.append(current)
+            elif current in visiting:
+                # Back at someone whose parents were all pushed above
+                # them, without those parents being placed
+                raise ValueError(f"pedigree has a cycle through {current}")
+            else:
+                visiting.add(current)
+                stack.extend(parents)
+    return order
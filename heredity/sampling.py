@@ -0,0 +1,335 @@
+import time
+
+import numpy as np
+
+from inference import inheritance_table, parents_first, trait_likelihood
+
+# Samples likelihood_weighting draws at once
+BATCH_SIZE = 1 << 14
+
+# Chains gibbs_sampling runs side by side, and sweeps each one makes
+# before its states are counted
+CHAINS = 1024
+BURN_IN = 50
+
+# Most people gibbs_sampling draws at once
+BLOCK_PEOPLE = 256
+
+
+class Pedigree():
+    """
+    A family as arrays for sampling: person i is `names[i]`, with
+    everyone after their parents, and mothers[i] and fathers[i] are
+    their parents' numbers, or -1 for people without parents in the data.
+    """
+
+    def __init__(self, people, probs):
+        self.names = parents_first(people)
+        index = {person: i for i, person in enumerate(self.names)}
+        self.mothers = np.full(len(self.names), -1)
+        self.fathers = np.full(len(self.names), -1)
+        for i, person in enumerate(self.names):
+            mother = people[person]["mother"]
+            father = people[person]["father"]
+            if mother and father:
+                self.mothers[i] = index[mother]
+                self.fathers[i] = index[father]
+
+        # children[i] lists (child, other parent, whether i is the
+        # mother) for the Markov blanket in Gibbs updates
+        self.children = [[] for _ in self.names]
+        for i in np.flatnonzero(self.mothers >= 0):
+            mother, father = self.mothers[i], self.fathers[i]
+            self.children[mother].append((i, father, True))
+            self.children[father].append((i, mother, False))
+
+        self.traits = [people[person]["trait"] for person in self.names]
+        self.prior = np.array([probs["gene"][gene] for gene in range(3)])
+        self.inheritance = inheritance_table(probs)
+        self.likelihood = np.array(
+            [trait_likelihood(probs, trait) for trait in self.traits]
+        ).reshape(len(self.names), 3)
+        self.trait_given_gene = trait_likelihood(probs, True)
+
+    def __len__(self):
+        return len(self.names)
+
+    def probabilities(self, gene_sums, trait_sums):
+        """
+        Returns the `heredity.main` probabilities structure from each
+        person's (unnormalized) weight on 0, 1 and 2 copies and on
+        having the trait.
+        """
+        probabilities = {}
+        for i, person in enumerate(self.names):
+            total = gene_sums[i].sum()
+            gene = gene_sums[i] / total if total else np.full(3, 1 / 3)
+            if self.traits[i] is None:
+                has_trait = trait_sums[i] / total if total else 0.0
+            else:
+                has_trait = 1.0 if self.traits[i] else 0.0
+            probabilities[person] = {
+                "gene": {2: float(gene[2]), 1: float(gene[1]), 0: float(gene[0])},
+                "trait": {True: float(has_trait), False: float(1 - has_trait)},
+            }
+        return probabilities
+
+
+def likelihood_weighting(people, probs, samples=None, seconds=None,
+                         seed=None):
+    """
+    Estimates each person's gene and trait distributions by drawing
+    gene counts for everyone from the pedigree, parents first, and
+    weighting each draw by the likelihood of the known traits.
+
+    Draws batches until `samples` draws or `seconds` have been spent,
+    whichever comes first. Returns (probabilities, report), where the
+    report has the draws made, time taken and the effective sample
+    size of the weights, (sum w) ** 2 / sum w ** 2.
+    """
+    pedigree = Pedigree(people, probs)
+    rng = np.random.default_rng(seed)
+    n = len(pedigree)
+    started = time.perf_counter()
+    prior = pedigree.prior[:, None]
+    by_parents = _by_parents(pedigree.inheritance)
+    log_likelihood = np.log(pedigree.likelihood)
+    people_axis = np.arange(n)[:, None]
+
+    # Weights are kept relative to exp(shift), the largest log weight
+    # so far, so that long pedigrees do not underflow
+    shift = -np.inf
+    gene_sums = np.zeros((n, 3))
+    trait_sums = np.zeros(n)
+    weight_sum = 0.0
+    square_sum = 0.0
+    drawn = 0
+    while not _done(drawn, samples, started, seconds):
+        size = BATCH_SIZE if samples is None else min(BATCH_SIZE, samples - drawn)
+
+        # genes[i] holds person i's gene count in every draw
+        genes = np.empty((n, size), dtype=np.int8)
+        for i in range(n):
+            if pedigree.mothers[i] < 0:
+                p = prior
+            else:
+                p = by_parents[:, 3 * genes[pedigree.mothers[i]]
+                               + genes[pedigree.fathers[i]]]
+            genes[i] = _draw(rng.random(size), p)
+
+        log_weights = log_likelihood[people_axis, genes].sum(axis=0)
+        top = log_weights.max()
+        if top > shift:
+            rescale = np.exp(shift - top)
+            gene_sums *= rescale
+            trait_sums *= rescale
+            weight_sum *= rescale
+            square_sum *= rescale ** 2
+            shift = top
+        weights = np.exp(log_weights - shift)
+
+        gene_sums += np.bincount(
+            (genes + 3 * people_axis).ravel(), weights=np.tile(weights, n),
+            minlength=3 * n,
+        ).reshape(n, 3)
+        trait_sums += pedigree.trait_given_gene[genes] @ weights
+        weight_sum += weights.sum()
+        square_sum += (weights ** 2).sum()
+        drawn += size
+
+    report = {
+        "samples": drawn,
+        "seconds": time.perf_counter() - started,
+        "ess": float(weight_sum ** 2 / square_sum) if square_sum else 0.0,
+    }
+    return pedigree.probabilities(gene_sums, trait_sums), report
+
+
+def gibbs_sampling(people, probs, samples=None, seconds=None, seed=None,
+                   chains=CHAINS, burn_in=BURN_IN):
+    """
+    Estimates each person's gene and trait distributions by Gibbs
+    sampling: `chains` chains advance side by side, each sweep drawing
+    every person's gene count given their parents', children's and
+    co-parents' and their own known trait. People who are not in each
+    other's conditionals are drawn together, a block at a time.
+
+    After `burn_in` sweeps, each person's conditional distribution is
+    added up at every sweep until about `samples` states or `seconds`
+    have been spent. Returns (probabilities, report), where the report's
+    effective sample size is the smallest over people of the number of
+    states times the ratio of the within-chain variance of their gene
+    count to the variance of the chains' means.
+    """
+    pedigree = Pedigree(people, probs)
+    rng = np.random.default_rng(seed)
+    n = len(pedigree)
+    started = time.perf_counter()
+    log_prior = np.log(pedigree.prior)[:, None, None]
+    log_inheritance = np.log(pedigree.inheritance)
+    log_by_parents = _by_parents(log_inheritance)
+    log_likelihood = np.log(pedigree.likelihood).T[:, :, None]
+
+    # by_child[g, 9 * role + 3 * other + child] is the log probability
+    # of a child's gene count given its other parent's, when the person
+    # with g copies is its father (role 0) or mother (role 1)
+    by_child = np.concatenate([
+        log_inheritance.transpose(1, 0, 2).reshape(3, 9),
+        log_inheritance.reshape(3, 9),
+    ], axis=1)
+
+    # Start from draws from the pedigree, ignoring the evidence;
+    # genes[i] holds person i's gene count in every chain
+    genes = np.empty((n, chains), dtype=np.int8)
+    by_parents = _by_parents(pedigree.inheritance)
+    for i in range(n):
+        if pedigree.mothers[i] < 0:
+            p = pedigree.prior[:, None]
+        else:
+            p = by_parents[:, 3 * genes[pedigree.mothers[i]]
+                           + genes[pedigree.fathers[i]]]
+        genes[i] = _draw(rng.random(chains), p)
+
+    blocks = _blocks(pedigree)
+    gene_sums = np.zeros((n, 3))
+    chain_sums = np.zeros((n, chains))
+    square_sums = np.zeros(n)
+    sweeps = 0
+    kept = 0
+    while True:
+        counting = sweeps >= burn_in
+        if counting and _done(kept * chains, samples, started, seconds):
+            break
+        for block in blocks:
+            members = block["members"]
+            founders = block["founders"]
+            log_p = np.empty((3, len(members), chains))
+            log_p[:, :founders] = log_prior
+            log_p[:, founders:] = log_by_parents[
+                :, 3 * genes[block["mothers"]] + genes[block["fathers"]]
+            ]
+            log_p += log_likelihood[:, members]
+            for slot in block["slots"]:
+                code = (slot["roles"] + 3 * genes[slot["others"]]
+                        + genes[slot["children"]])
+                log_p[:, slot["positions"]] += by_child[:, code]
+            log_p -= log_p.max(axis=0)
+            p = np.exp(log_p, out=log_p)
+            p /= p.sum(axis=0)
+            genes[members] = _draw(rng.random((len(members), chains)), p)
+            if counting:
+                gene_sums[members] += p.sum(axis=2).T
+        sweeps += 1
+        if counting:
+            chain_sums += genes
+            square_sums += (genes.astype(np.int64) ** 2).sum(axis=1)
+            kept += 1
+        if not counting and seconds is not None and samples is None:
+            # A time budget also bounds burn-in
+            if time.perf_counter() - started >= seconds:
+                break
+
+    report = {
+        "samples": kept * chains,
+        "sweeps": sweeps,
+        "seconds": time.perf_counter() - started,
+        "ess": _chain_ess(chain_sums, square_sums, kept),
+    }
+    if not kept:
+        gene_sums[:] = np.bincount(
+            (genes + 3 * np.arange(n)[:, None]).ravel(), minlength=3 * n
+        ).reshape(n, 3)
+    trait_sums = gene_sums @ pedigree.trait_given_gene
+    return pedigree.probabilities(gene_sums, trait_sums), report
+
+
+def _blocks(pedigree):
+    """
+    Splits the pedigree into blocks of people none of whom are parent,
+    child or co-parent of another, so that a block can be drawn at once,
+    by greedily colouring them. Each block lists its `members`, the
+    first `founders` of them without parents and the rest's `mothers`
+    and `fathers`. Its `slots` hold, for each k, the `positions` in the
+    block of the members with a k-th child, and those `children`, their
+    `others` parents and `roles` (9 if the member is the mother, else 0).
+    """
+    colours = np.full(len(pedigree), -1)
+    members = []
+    for i in range(len(pedigree)):
+        near = [pedigree.mothers[i], pedigree.fathers[i]]
+        for child, other, _is_mother in pedigree.children[i]:
+            near += [child, other]
+        taken = {colours[j] for j in near if j >= 0}
+        colour = next(c for c in range(len(members) + 1) if c not in taken)
+        if colour == len(members):
+            members.append([])
+        colours[i] = colour
+        members[colour].append(i)
+
+    blocks = []
+    for group in members:
+        for lo in range(0, len(group), BLOCK_PEOPLE):
+            block = np.array(group[lo:lo + BLOCK_PEOPLE])
+            block = block[np.argsort(pedigree.mothers[block] >= 0, kind="stable")]
+            founders = int((pedigree.mothers[block] < 0).sum())
+            slots = []
+            for position, i in enumerate(block):
+                for k, (child, other, is_mother) in enumerate(pedigree.children[i]):
+                    if k == len(slots):
+                        slots.append(([], [], [], []))
+                    for column, value in zip(slots[k], (position, child, other,
+                                                        9 * is_mother)):
+                        column.append(value)
+            blocks.append({
+                "members": block,
+                "founders": founders,
+                "mothers": pedigree.mothers[block[founders:]],
+                "fathers": pedigree.fathers[block[founders:]],
+                "slots": [
+                    {
+                        "positions": np.array(positions),
+                        "children": np.array(children),
+                        "others": np.array(others),
+                        "roles": np.array(roles, dtype=np.int8)[:, None],
+                    }
+                    for positions, children, others, roles in slots
+                ],
+            })
+    return blocks
+
+
+def _chain_ess(chain_sums, square_sums, kept):
+    if kept < 2:
+        return float(kept * chain_sums.shape[1])
+    total = kept * chain_sums.shape[1]
+    means = chain_sums / kept
+    variance = square_sums / total - (chain_sums.sum(axis=1) / total) ** 2
+    between = means.var(axis=1)
+    varying = (variance > 1e-12) & (between > 0)
+    if not varying.any():
+        return float(total)
+    ess = chain_sums.shape[1] * variance[varying] / between[varying]
+    return float(min(total, ess.min()))
+
+
+def _by_parents(table):
+    """
+    Returns an inheritance table as by_parents[child, 3 * mother + father].
+    """
+    return table.transpose(2, 0, 1).reshape(3, 9)
+
+
+def _draw(u, p):
+    """
+    Returns the gene counts drawn with uniform numbers `u` from the
+    distributions p[0], p[1] and p[2] of 0, 1 and 2 copies.
+    """
+    return (u >= p[0]).astype(np.int8) + (u >= p[0] + p[1])
+
+
+def _done(drawn, samples, started, seconds):
+    if samples is not None and drawn >= samples:
+        return True
+    if seconds is not None and time.perf_counter() - started >= seconds:
+        return True
+    return False
@@ -0,0 +1,281 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import crawler
+import crawlindex
+import pagerank
+import sharded
+from engine import LinkGraph, SOLVERS, unique_sorted
+
+# Edge list written by `generate --output edges`, read instead of crawling
+EDGE_FILE = "edges.npz"
+
+CRAWL_VARIANTS = ("crawl:dict", "crawl:parallel", "crawl:index",
+                  "crawl:index-warm")
+RANK_VARIANTS = (
+    ("sample",)
+    + tuple(f"iterate:{solver}" for solver in SOLVERS)
+    + ("iterate:sharded",)
+)
+
+# Successive blocks of pages generate() links at once grow by this factor
+GROWTH = 1.25
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python benchmark.py {generate,run} directory [options]")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser(
+        "generate", help="write a synthetic HTML corpus or edge list")
+    generate_parser.add_argument("directory")
+    generate_parser.add_argument("--pages", type=int, default=1000)
+    generate_parser.add_argument("--links", type=float, default=8,
+                                 help="mean links per page that has any")
+    generate_parser.add_argument("--dangling", type=float, default=0.1,
+                                 help="fraction of pages without links")
+    generate_parser.add_argument("--self-links", type=float, default=0.01,
+                                 help="fraction of links to the same page")
+    generate_parser.add_argument("--uniform", type=float, default=0.2,
+                                 help="fraction of links to a uniformly "
+                                      "random page instead of by popularity")
+    generate_parser.add_argument("--output", choices=("html", "edges"),
+                                 default="html")
+    generate_parser.add_argument("--seed", type=int, default=0)
+
+    run_parser = commands.add_parser(
+        "run", help="time crawling and every PageRank variant")
+    run_parser.add_argument("directory")
+    run_parser.add_argument("--samples", type=int, default=1000000)
+    run_parser.add_argument("--damping", type=float, default=pagerank.DAMPING)
+    run_parser.add_argument("--processes", type=int, default=os.cpu_count())
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--variants", nargs="+", metavar="VARIANT",
+                            help="default: every crawl variant for HTML "
+                                 "corpora, then " + " ".join(RANK_VARIANTS))
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        stats = generate(args.directory, args.pages, args.links,
+                         args.dangling, args.self_links, args.uniform,
+                         args.output, args.seed)
+    else:
+        variants = args.variants
+        if variants is None:
+            variants = RANK_VARIANTS
+            if not os.path.exists(os.path.join(args.directory, EDGE_FILE)):
+                variants = CRAWL_VARIANTS + variants
+        stats = run(args.directory, variants, args.samples, args.damping,
+                    args.processes, args.seed)
+    print(json.dumps(stats, indent=2))
+
+
+def generate(directory, num_pages, links=8, dangling=0.1, self_links=0.01,
+             uniform=0.2, output="html", seed=0):
+    """
+    Writes a synthetic web graph of `num_pages` pages to `directory`,
+    as one HTML file per page, or as an EDGE_FILE edge list if `output`
+    is "edges".
+
+    Link counts are geometric with mean `links`, except for a
+    `dangling` fraction of pages that have none. Pages mostly link to
+    pages earlier in the corpus by preferential attachment, by copying
+    the target of an earlier link, and otherwise to a uniformly random
+    one; a `self_links` fraction link to themselves. Repeated links
+    between two pages are kept, as a crawl has to handle them.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    degree = rng.geometric(1 / links, num_pages)
+    degree[rng.random(num_pages) < dangling] = 0
+    sources = np.repeat(np.arange(num_pages), degree)
+    targets = np.empty_like(sources)
+
+    # Links are drawn a block of pages at a time, each block copying
+    # targets only from the blocks before it
+    offsets = np.zeros(num_pages + 1, dtype=np.int64)
+    np.cumsum(degree, out=offsets[1:])
+    lo = 0
+    while lo < num_pages:
+        hi = min(num_pages, max(lo + 1000, int(lo * GROWTH)))
+        start, end = offsets[lo], offsets[hi]
+        chosen = rng.integers(0, hi, end - start)
+        if start:
+            copy = rng.random(end - start) >= uniform
+            chosen[copy] = targets[rng.integers(0, start, copy.sum())]
+        targets[start:end] = chosen
+        lo = hi
+    loops = rng.random(len(sources)) < self_links
+    targets[loops] = sources[loops]
+
+    if output == "edges":
+        np.savez(os.path.join(directory, EDGE_FILE),
+                 pages=num_pages, sources=sources, targets=targets)
+    else:
+        for page in range(num_pages):
+            with open(os.path.join(directory, f"{page}.html"), "w",
+                      encoding="utf-8") as f:
+                f.write(_html(page, targets[offsets[page]:offsets[page + 1]]))
+
+    return {
+        "pages": num_pages,
+        "links": len(sources),
+        "dangling": int((degree == 0).sum()),
+        "self_links": int(loops.sum()),
+    }
+
+
+def load_edges(directory):
+    """
+    Returns the LinkGraph of an EDGE_FILE edge list, without self-links
+    or repeated links, as a crawl of the same pages would find it.
+    """
+    with np.load(os.path.join(directory, EDGE_FILE)) as edges:
+        n = int(edges["pages"])
+        keep = edges["sources"] != edges["targets"]
+        links = unique_sorted(
+            edges["sources"][keep] * max(1, n) + edges["targets"][keep]
+        )
+    pages = [f"{page}.html" for page in range(n)]
+    return LinkGraph(pages, links // max(1, n), links % max(1, n))
+
+
+def run(directory, variants, samples=1000000, damping=pagerank.DAMPING,
+        processes=None, seed=0):
+    """
+    Runs each variant in a fresh process, so that its peak memory is its
+    own, and returns its time and peak RSS. Variants that rank pages
+    also report the L1 distance of their ranks from iterate:power's,
+    which for "sample" is the sampling error.
+    """
+    results = {
+        "directory": directory,
+        "samples": samples,
+        "damping": damping,
+        "variants": [],
+    }
+    ranks = {}
+    for variant in variants:
+        report = _in_subprocess(
+            _run_variant, directory, variant, samples, damping, processes,
+            seed,
+        )
+        if "ranks" in report:
+            ranks[variant] = report.pop("ranks")
+        results["variants"].append(report)
+
+    reference = ranks.get("iterate:power")
+    if reference is None and ranks:
+        reference = _in_subprocess(
+            _run_variant, directory, "iterate:power", samples, damping,
+            processes, seed,
+        )["ranks"]
+    for report in results["variants"]:
+        if report["variant"] in ranks:
+            report["l1_vs_iterate"] = float(
+                np.abs(ranks[report["variant"]] - reference).sum()
+            )
+    return results
+
+
+def _in_subprocess(function, *args):
+    # Pool workers are daemons, which may not start the crawler's pool
+    with ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(function, *args).result()
+
+
+def _run_variant(directory, variant, samples, damping, processes, seed):
+    # A spawned process would start its own pools by spawning too, with
+    # every worker importing NumPy again; use the platform default
+    multiprocessing.set_start_method(None, force=True)
+    report = {"variant": variant}
+    kind, _, name = variant.partition(":")
+    if kind == "crawl":
+        if name == "index-warm":
+            crawlindex.load_corpus(directory, processes=processes)
+        started = time.perf_counter()
+        if name == "dict":
+            pagerank.crawl(directory)
+        elif name == "parallel":
+            crawler.crawl_graph(directory, processes)
+        elif name == "index":
+            crawlindex.load_corpus(directory, rebuild=True, processes=processes)
+        elif name == "index-warm":
+            crawlindex.load_corpus(directory, processes=processes)
+        else:
+            raise ValueError(f"unknown variant: {variant}")
+        report["seconds"] = time.perf_counter() - started
+        report["peak_rss_mb"] = _peak_rss()
+        return report
+
+    started = time.perf_counter()
+    graph = _load_graph(directory, processes)
+    report["load_s"] = time.perf_counter() - started
+    report["pages"] = len(graph)
+    report["links"] = len(graph.sources)
+
+    started = time.perf_counter()
+    if kind == "sample":
+        ranks = pagerank.sample_pagerank(graph, damping, samples, seed=seed)
+    elif kind == "iterate" and name == "sharded":
+        with tempfile.TemporaryDirectory() as shards:
+            sharded.write_shards(graph, shards, processes or os.cpu_count())
+            ranks, iterations, _residual = sharded.sharded_pagerank(
+                shards, damping, processes=processes
+            )
+        ranks = graph.ranks_dict(ranks)
+        report["iterations"] = iterations
+    elif kind == "iterate" and name in SOLVERS:
+        trace = []
+        ranks = pagerank.iterate_pagerank(graph, damping, solver=name,
+                                          trace=trace)
+        report["iterations"] = len(trace)
+    else:
+        raise ValueError(f"unknown variant: {variant}")
+    report["seconds"] = time.perf_counter() - started
+    report["peak_rss_mb"] = _peak_rss()
+    report["ranks"] = np.fromiter(ranks.values(), dtype=float, count=len(ranks))
+    return report
+
+
+def _load_graph(directory, processes):
+    if os.path.exists(os.path.join(directory, EDGE_FILE)):
+        return load_edges(directory)
+    graph, _skipped, _changes = crawlindex.load_corpus(
+        directory, processes=processes
+    )
+    return graph
+
+
+def _html(page, targets):
+    links = "\n".join(
+        f'    <li><a href="{target}.html">Page {target}</a></li>'
+        for target in targets
+    )
+    return (
+        f"<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n"
+        f"  <title>{page}</title>\n</head>\n<body>\n"
+        f"  <h1>{page}</h1>\n  <ul>\n{links}\n  </ul>\n</body>\n</html>\n"
+    )
+
+
+def _peak_rss():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import codecs
+import hashlib
+import multiprocessing
+import os
+import re
+
+import numpy as np
+
+from engine import LinkGraph, unique_sorted
+
+LINK_PATTERN = re.compile(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
+
+# Characters read per chunk, and how much of a chunk's tail is carried
+# into the next so that a link split across the boundary is still found
+CHUNK_SIZE = 1 << 20
+OVERLAP = 8192
+
+# Bytes in the content hash scan_page returns for each page
+DIGEST_SIZE = 16
+
+
+def crawl_graph(directory, processes=None):
+    """
+    Parse a directory of HTML pages across a process pool, like `crawl`,
+    and return (graph, skipped): a LinkGraph of the links between pages
+    in the corpus, and a dictionary of page -> reason for every page
+    that could not be read or is not valid UTF-8 and was left out.
+    """
+    filenames = sorted(
+        filename for filename in os.listdir(directory)
+        if filename.endswith(".html")
+    )
+    paths = [os.path.join(directory, filename) for filename in filenames]
+
+    links = {}
+    skipped = {}
+    for filename, found, _digest, error in scan_pages(paths, processes):
+        if error is None:
+            links[filename] = found
+        else:
+            skipped[filename] = error
+
+    pages = [filename for filename in filenames if filename in links]
+    index = {page: i for i, page in enumerate(pages)}
+    sources = []
+    targets = []
+    for page, found in links.items():
+        i = index[page]
+        for link in found:
+            j = index.get(link)
+            if j is not None and j != i:
+                sources.append(i)
+                targets.append(j)
+    del links
+
+    # A page linking to another several times is still one link
+    n = max(1, len(pages))
+    edges = unique_sorted(np.asarray(sources, dtype=np.int64) * n + targets)
+    return LinkGraph(pages, edges // n, edges % n), skipped
+
+
+def scan_pages(paths, processes=None):
+    """
+    Yields scan_page(path) for each of `paths`, in no particular order,
+    scanning them across a process pool.
+    """
+    if not paths:
+        return
+    chunksize = max(1, len(paths) // (4 * (processes or os.cpu_count())))
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap_unordered(scan_page, paths, chunksize=chunksize)
+
+
+def scan_page(path):
+    """
+    Returns (filename, links, digest, error) for one HTML file, scanning
+    it in chunks. `links` is the set of hrefs found and `digest` a hash of
+    the file's bytes, or both are None with `error` describing why the
+    page could not be read.
+    """
+    filename = os.path.basename(path)
+    links = set()
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as f:
+            carry = ""
+            while True:
+                data = f.read(CHUNK_SIZE)
+                digest.update(data)
+                buffer = carry + decoder.decode(data, final=not data)
+                end = 0
+                for match in LINK_PATTERN.finditer(buffer):
+                    links.add(match.group(1))
+                    end = match.end()
+                if not data:
+                    break
+                carry = buffer[max(end, len(buffer) - OVERLAP):]
+    except UnicodeDecodeError:
+        return filename, None, None, "not valid UTF-8"
+    except OSError as e:
+        return filename, None, None, e.strerror or str(e)
+    return filename, links, digest.digest(), None
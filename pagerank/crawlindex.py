@@ -0,0 +1,325 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from crawler import DIGEST_SIZE, scan_pages
+from engine import LinkGraph
+
+INDEX_FILE = "pagerank.index"
+
+MAGIC = b"PRINDEX1"
+# Magic followed by the byte length of the JSON header
+PREAMBLE = struct.Struct("<8sQ")
+ALIGN = 8
+
+
+class CrawlIndex():
+    """
+    The result of crawling a corpus, kept so that a later crawl only
+    re-parses the pages that changed.
+
+    Page i is `pages[i]`, in sorted order, with the (size, mtime) stamp
+    and content digest it was parsed at. Its links to other pages are
+    targets[offsets[i]:offsets[i + 1]], and the hrefs it has to pages
+    outside the corpus are hrefs[href_offsets[i]:href_offsets[i + 1]],
+    kept in case those pages are added later. `skipped` maps each page
+    that could not be read to [size, mtime, reason].
+    """
+
+    def __init__(self, pages, stamps, digests, offsets, targets,
+                 href_offsets, hrefs, skipped):
+        self.pages = pages
+        self.stamps = stamps
+        self.digests = digests
+        self.offsets = offsets
+        self.targets = targets
+        self.href_offsets = href_offsets
+        self.hrefs = hrefs
+        self.skipped = skipped
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            [], np.zeros((0, 2), dtype=np.int64),
+            np.zeros((0, DIGEST_SIZE), dtype=np.uint8),
+            np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+            np.zeros(1, dtype=np.int64), [], {},
+        )
+
+    def graph(self):
+        """
+        Returns the indexed corpus as a LinkGraph.
+        """
+        sources = np.repeat(np.arange(len(self.pages)), np.diff(self.offsets))
+        return LinkGraph(self.pages, sources, self.targets)
+
+    def update(self, directory, processes=None):
+        """
+        Brings the index up to date with `directory`, re-parsing only the
+        pages whose size or mtime changed, and only rebuilding the link
+        rows of pages whose contents did. Returns a dictionary of the
+        "added", "changed" and "removed" pages, and those "touched" but
+        still the same.
+        """
+        stamps = {}
+        for filename in os.listdir(directory):
+            if filename.endswith(".html"):
+                st = os.stat(os.path.join(directory, filename))
+                stamps[filename] = (st.st_size, st.st_mtime_ns)
+
+        index = {page: i for i, page in enumerate(self.pages)}
+        stale = []
+        for filename, stamp in stamps.items():
+            i = index.get(filename)
+            if i is not None:
+                current = tuple(self.stamps[i]) == stamp
+            else:
+                current = tuple(self.skipped.get(filename, ())[:2]) == stamp
+            if not current:
+                stale.append(filename)
+
+        skipped = {
+            filename: entry for filename, entry in self.skipped.items()
+            if filename in stamps and filename not in stale
+        }
+        touched = {}
+        rows = {}
+        paths = [os.path.join(directory, filename) for filename in stale]
+        for filename, links, digest, error in scan_pages(paths, processes):
+            stamp = stamps[filename]
+            i = index.get(filename)
+            if error is not None:
+                skipped[filename] = [*stamp, error]
+            elif i is not None and digest == self.digests[i].tobytes():
+                # Touched but not edited: only the stamp is out of date
+                touched[filename] = stamp
+            else:
+                rows[filename] = (links, digest, stamp)
+
+        pages = sorted(
+            page for page in stamps
+            if page not in skipped and (page in index or page in rows)
+        )
+        new_index = {page: i for i, page in enumerate(pages)}
+        remap = np.array(
+            [new_index.get(page, -1) for page in self.pages], dtype=np.int64
+        )
+        kept = remap >= 0
+        for page in rows:
+            if page in index:
+                kept[index[page]] = False
+
+        # Rows that did not change keep their links, renumbered; links to
+        # removed pages become hrefs, and hrefs to added pages links
+        old_sources = np.repeat(np.arange(len(self.pages)), np.diff(self.offsets))
+        mask = kept[old_sources]
+        sources = remap[old_sources[mask]]
+        targets = remap[self.targets[mask]]
+        gone = targets < 0
+        href_sources = list(sources[gone])
+        hrefs = [self.pages[j] for j in self.targets[mask][gone]]
+        sources = [sources[~gone]]
+        targets = [targets[~gone]]
+
+        old_href_sources = np.repeat(
+            np.arange(len(self.pages)), np.diff(self.href_offsets)
+        )
+        mask = kept[old_href_sources]
+        kept_hrefs = [href for href, keep in zip(self.hrefs, mask) if keep]
+        kept_sources = remap[old_href_sources[mask]]
+        if any(page not in index for page in rows):
+            added_sources = []
+            added_targets = []
+            for i, href in zip(kept_sources.tolist(), kept_hrefs):
+                j = new_index.get(href)
+                if j is None:
+                    href_sources.append(i)
+                    hrefs.append(href)
+                else:
+                    added_sources.append(i)
+                    added_targets.append(j)
+            sources.append(np.array(added_sources, dtype=np.int64))
+            targets.append(np.array(added_targets, dtype=np.int64))
+        else:
+            href_sources.extend(kept_sources.tolist())
+            hrefs.extend(kept_hrefs)
+
+        # Changed and added pages get their rows built afresh
+        row_sources = []
+        row_targets = []
+        for page, (links, _digest, _stamp) in rows.items():
+            i = new_index[page]
+            for link in links:
+                j = new_index.get(link)
+                if j is None:
+                    href_sources.append(i)
+                    hrefs.append(link)
+                elif j != i:
+                    row_sources.append(i)
+                    row_targets.append(j)
+        sources.append(np.array(row_sources, dtype=np.int64))
+        targets.append(np.array(row_targets, dtype=np.int64))
+
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+        order = np.lexsort((targets, sources))
+        href_sources = np.array(href_sources, dtype=np.int64)
+        href_order = np.argsort(href_sources, kind="stable")
+
+        n = len(pages)
+        new_stamps = np.zeros((n, 2), dtype=np.int64)
+        new_digests = np.zeros((n, DIGEST_SIZE), dtype=np.uint8)
+        old = remap[remap >= 0]
+        new_stamps[old] = self.stamps[remap >= 0]
+        new_digests[old] = self.digests[remap >= 0]
+        for page, stamp in touched.items():
+            new_stamps[new_index[page]] = stamp
+        for page, (_links, digest, stamp) in rows.items():
+            new_stamps[new_index[page]] = stamp
+            new_digests[new_index[page]] = np.frombuffer(digest, dtype=np.uint8)
+
+        changes = {
+            "added": sorted(page for page in rows if page not in index),
+            "changed": sorted(page for page in rows if page in index),
+            "removed": sorted(page for page in index if page not in new_index),
+            "touched": sorted(touched),
+        }
+
+        self.pages = pages
+        self.stamps = new_stamps
+        self.digests = new_digests
+        self.offsets = _offsets(sources, n)
+        self.targets = targets[order].astype(np.int32)
+        self.href_offsets = _offsets(href_sources, n)
+        self.hrefs = [hrefs[k] for k in href_order]
+        self.skipped = skipped
+        return changes
+
+
+def load_corpus(directory, rebuild=False, processes=None):
+    """
+    Crawls `directory` like crawler.crawl_graph, re-parsing only pages
+    changed since the index saved there by the last crawl, and saves
+    the updated index. Returns (graph, skipped, changes), where `changes`
+    lists the pages added, changed and removed since that crawl.
+    """
+    path = os.path.join(directory, INDEX_FILE)
+    index = None if rebuild else read_index(path)
+    if index is None:
+        index = CrawlIndex.empty()
+        rebuild = True
+    skipped = index.skipped
+    changes = index.update(directory, processes)
+    if rebuild or any(changes.values()) or index.skipped != skipped:
+        try:
+            write_index(index, path)
+        except OSError:
+            # A read-only corpus just means a full crawl next time
+            pass
+    skipped = {page: entry[2] for page, entry in index.skipped.items()}
+    del changes["touched"]
+    return index.graph(), skipped, changes
+
+
+def write_index(index, path):
+    """
+    Writes `index` to `path`.
+    """
+    sections = [
+        ("stamps", index.stamps.ravel()),
+        ("digests", index.digests.ravel()),
+        ("offsets", index.offsets),
+        ("targets", index.targets),
+        ("href_offsets", index.href_offsets),
+    ]
+    for name, strings in (("pages", index.pages), ("hrefs", index.hrefs)):
+        offsets, blob = _encode_strings(strings)
+        sections.append((name + ".offsets", offsets))
+        sections.append((name + ".blob", blob))
+
+    layout = {}
+    position = 0
+    for name, data in sections:
+        position = _align(position)
+        layout[name] = [position, data.nbytes, data.dtype.str]
+        position += data.nbytes
+
+    header = json.dumps(
+        {"skipped": index.skipped, "sections": layout}
+    ).encode("utf-8")
+    base = _align(PREAMBLE.size + len(header))
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, len(header)))
+        f.write(header)
+        for name, data in sections:
+            f.seek(base + layout[name][0])
+            f.write(data.tobytes())
+        f.truncate(base + position)
+    os.replace(tmp, path)
+
+
+def read_index(path):
+    """
+    Returns the CrawlIndex saved at `path`, or None if it is missing or
+    unreadable.
+    """
+    try:
+        with open(path, "rb") as f:
+            buffer = f.read()
+        magic, header_size = PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC:
+            return None
+        header = json.loads(
+            buffer[PREAMBLE.size:PREAMBLE.size + header_size].decode("utf-8")
+        )
+    except (OSError, struct.error, ValueError):
+        return None
+
+    base = _align(PREAMBLE.size + header_size)
+
+    def section(name):
+        offset, size, dtype = header["sections"][name]
+        return np.frombuffer(
+            buffer, dtype=dtype, count=size // np.dtype(dtype).itemsize,
+            offset=base + offset,
+        )
+
+    def strings(name):
+        offsets = section(name + ".offsets").tolist()
+        blob = section(name + ".blob").tobytes()
+        return [
+            blob[offsets[i]:offsets[i + 1]].decode("utf-8")
+            for i in range(len(offsets) - 1)
+        ]
+
+    return CrawlIndex(
+        strings("pages"),
+        section("stamps").reshape(-1, 2),
+        section("digests").reshape(-1, DIGEST_SIZE),
+        section("offsets"),
+        section("targets"),
+        section("href_offsets"),
+        strings("hrefs"),
+        header["skipped"],
+    )
+
+
+def _offsets(sources, n):
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+    return offsets
+
+
+def _encode_strings(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _align(position):
+    return (position + ALIGN - 1) // ALIGN * ALIGN
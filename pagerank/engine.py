@@ -0,0 +1,435 @@
+import time
+from collections import deque
+
+import numpy as np
+import scipy.sparse
+from scipy.sparse.linalg import splu
+
+# Default L1 change between iterations at which power iteration stops
+TOLERANCE = 1e-6
+MAX_ITERATIONS = 1000
+
+# Power iterations extrapolated_iteration runs between extrapolations
+EXTRAPOLATE_EVERY = 10
+
+# forward_push leaves at most this much unpushed residual per out-link
+PUSH_EPSILON = 1e-7
+
+# Surfers random_surfers advances together, steps each one takes before
+# its visits are counted, and samples counted per bincount
+SURFERS = 10000
+BURN_IN = 50
+CHUNK_SAMPLES = 1 << 22
+
+
+class LinkGraph():
+    """
+    Integer-indexed link graph: page i is `pages[i]`, and edge k is a
+    link from page `sources[k]` to page `targets[k]`.
+    """
+
+    def __init__(self, pages, sources, targets):
+        self.pages = list(pages)
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        Builds a graph from a `crawl` dictionary of page -> linked pages,
+        ignoring links to pages outside the corpus.
+        """
+        pages = sorted(corpus)
+        index = {page: i for i, page in enumerate(pages)}
+        sources = []
+        targets = []
+        for page in pages:
+            i = index[page]
+            for link in corpus[page]:
+                j = index.get(link)
+                if j is not None and j != i:
+                    sources.append(i)
+                    targets.append(j)
+        return cls(pages, sources, targets)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def with_changes(self, added_pages=(), removed_pages=(), added_links=(),
+                     removed_links=()):
+        """
+        Returns a copy of the graph with pages added and removed, and links
+        given as (page, linked page) pairs added and removed. Removing a
+        page removes its links; links to or from pages not in the new
+        graph are ignored, like links outside a corpus.
+        """
+        removed = set(removed_pages)
+        pages = sorted((set(self.pages) | set(added_pages)) - removed)
+        index = {page: i for i, page in enumerate(pages)}
+        n = max(1, len(pages))
+
+        def keys(links):
+            return np.array([
+                index[source] * n + index[target] for source, target in links
+                if source in index and target in index and source != target
+            ], dtype=np.int64)
+
+        remap = np.array(
+            [index.get(page, -1) for page in self.pages], dtype=np.int64
+        )
+        sources = remap[self.sources]
+        targets = remap[self.targets]
+        kept = (sources >= 0) & (targets >= 0)
+        edges = sources[kept] * n + targets[kept]
+        edges = edges[~np.isin(edges, keys(removed_links))]
+        edges = unique_sorted(np.concatenate([edges, keys(added_links)]))
+        return LinkGraph(pages, edges // n, edges % n)
+
+    def out_degree(self):
+        return np.bincount(self.sources, minlength=len(self))
+
+    def out_links(self):
+        """
+        Returns (offsets, links): page i links to
+        links[offsets[i]:offsets[i + 1]].
+        """
+        order = np.argsort(self.sources, kind="stable")
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(self.out_degree(), out=offsets[1:])
+        return offsets, self.targets[order]
+
+    def transition(self):
+        """
+        Returns (matrix, dangling): `matrix` is the sparse column-stochastic
+        link matrix, with matrix[j, i] = 1 / out_degree(i) for each link
+        i -> j, and `dangling` a boolean mask of pages with no links,
+        whose rank is spread over every page instead.
+        """
+        n = len(self)
+        degree = self.out_degree()
+        matrix = scipy.sparse.csr_matrix(
+            (1.0 / degree[self.sources], (self.targets, self.sources)),
+            shape=(n, n),
+        )
+        return matrix, degree == 0
+
+    def ranks_dict(self, ranks):
+        """
+        Returns a rank vector as the page -> rank dictionary pagerank.py
+        functions return.
+        """
+        return {page: float(rank) for page, rank in zip(self.pages, ranks)}
+
+
+def unique_sorted(values):
+    """
+    Returns the distinct values of an integer array in ascending order,
+    like np.unique, which hashes rather than sorts and is many times
+    slower on millions of edge keys.
+    """
+    values = np.sort(values)
+    keep = np.ones(len(values), dtype=bool)
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    return values[keep]
+
+
+def power_iteration(matrix, dangling, damping_factor, tolerance=TOLERANCE,
+                    max_iterations=MAX_ITERATIONS, start=None, teleport=None,
+                    trace=None):
+    """
+    Runs r <- d * (M r + dangling rank / N) + (1 - d) / N from `start`
+    (uniform by default) until the L1 change drops below `tolerance`.
+
+    With a `teleport` distribution, random jumps and the rank of
+    dangling pages go to it instead of spreading evenly. `teleport` may
+    be an (N, k) matrix of k distributions, in which case all k rank
+    vectors are iterated together as the columns of `ranks`.
+
+    Returns (ranks, iterations, residual), where residual is the last
+    L1 change (the largest over the columns). If `trace` is a list, an
+    (elapsed seconds, residual) pair is appended to it every iteration;
+    the other solvers in SOLVERS take the same arguments.
+    """
+    n = matrix.shape[0]
+    shape = (n,) if teleport is None else np.shape(teleport)
+    if n == 0:
+        return np.zeros(shape), 0, 0.0
+    started = time.perf_counter()
+    jump, ranks = _initial(n, start, teleport)
+
+    # Only rows some teleport distribution lands on get a jump term
+    targets = np.flatnonzero(jump if jump.ndim == 1 else jump.any(axis=1))
+    jump = jump[targets]
+
+    residual = np.inf
+    iterations = 0
+    while residual > tolerance and iterations < max_iterations:
+        spread = damping_factor * ranks[dangling].sum(axis=0) + (1 - damping_factor)
+        new_ranks = matrix @ ranks
+        new_ranks *= damping_factor
+        new_ranks[targets] += spread * jump
+        ranks -= new_ranks
+        np.abs(ranks, out=ranks)
+        residual = ranks.sum(axis=0).max()
+        ranks = new_ranks
+        iterations += 1
+        if trace is not None:
+            trace.append((time.perf_counter() - started, residual))
+
+    return ranks, iterations, residual
+
+
+def gauss_seidel(matrix, dangling, damping_factor, tolerance=TOLERANCE,
+                 max_iterations=MAX_ITERATIONS, start=None, teleport=None,
+                 trace=None):
+    """
+    Like power_iteration, but each sweep uses the ranks already updated
+    earlier in the same sweep: with M split into its strictly lower part
+    L and the rest U, a sweep solves (I - d L) r' = d U r + jumps by
+    forward substitution. Dangling rank is taken from the previous
+    sweep. `teleport` must be a single distribution.
+    """
+    n = matrix.shape[0]
+    if n == 0:
+        return np.zeros(0), 0, 0.0
+    started = time.perf_counter()
+    jump, ranks = _initial(n, start, teleport)
+    # Factoring the triangular I - d L in its natural order has no
+    # fill-in, and makes each sweep a single forward substitution
+    lower = scipy.sparse.tril(matrix, -1)
+    lower = scipy.sparse.identity(n) - damping_factor * lower
+    lower = splu(lower.tocsc(), permc_spec="NATURAL", diag_pivot_thresh=0)
+    upper = scipy.sparse.triu(matrix, 0).tocsr()
+
+    residual = np.inf
+    iterations = 0
+    while residual > tolerance and iterations < max_iterations:
+        spread = damping_factor * ranks[dangling].sum() + (1 - damping_factor)
+        rhs = damping_factor * (upper @ ranks) + spread * jump
+        new_ranks = lower.solve(rhs)
+        new_ranks /= new_ranks.sum()
+        residual = np.abs(new_ranks - ranks).sum()
+        ranks = new_ranks
+        iterations += 1
+        if trace is not None:
+            trace.append((time.perf_counter() - started, residual))
+
+    return ranks, iterations, residual
+
+
+def extrapolated_iteration(matrix, dangling, damping_factor,
+                           tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS,
+                           start=None, teleport=None, trace=None):
+    """
+    Like power_iteration, but every EXTRAPOLATE_EVERY iterations the
+    last four iterates are combined by quadratic extrapolation (Kamvar
+    et al.), a generalisation of Aitken's delta-squared method that
+    cancels the slowest-decaying error terms. `teleport` must be a
+    single distribution.
+    """
+    n = matrix.shape[0]
+    if n == 0:
+        return np.zeros(0), 0, 0.0
+    started = time.perf_counter()
+    jump, ranks = _initial(n, start, teleport)
+    history = deque(maxlen=3)
+
+    residual = np.inf
+    iterations = 0
+    while residual > tolerance and iterations < max_iterations:
+        spread = damping_factor * ranks[dangling].sum() + (1 - damping_factor)
+        new_ranks = damping_factor * (matrix @ ranks) + spread * jump
+        residual = np.abs(new_ranks - ranks).sum()
+        history.append(ranks)
+        ranks = new_ranks
+        iterations += 1
+        if (iterations % EXTRAPOLATE_EVERY == 0 and len(history) == 3
+                and residual > tolerance):
+            ranks = _quadratic_extrapolation(*history, ranks)
+            history.clear()
+        if trace is not None:
+            trace.append((time.perf_counter() - started, residual))
+
+    return ranks, iterations, residual
+
+
+def adaptive_iteration(matrix, dangling, damping_factor, tolerance=TOLERANCE,
+                       max_iterations=MAX_ITERATIONS, start=None,
+                       teleport=None, trace=None):
+    """
+    Like power_iteration, but stops recomputing a page once its rank
+    changes by less than `tolerance` times itself in two iterations in
+    a row, so that later
+    iterations only touch the rows of pages still converging. Once
+    those converge, every page is unfrozen for a full iteration, and
+    it only stops when that one converges too. `teleport` must be a
+    single distribution.
+    """
+    n = matrix.shape[0]
+    if n == 0:
+        return np.zeros(0), 0, 0.0
+    started = time.perf_counter()
+    jump, ranks = _initial(n, start, teleport)
+    active = np.arange(n)
+    rows = matrix
+    quiet = np.zeros(n, dtype=bool)
+
+    residual = np.inf
+    iterations = 0
+    while residual > tolerance and iterations < max_iterations:
+        spread = damping_factor * ranks[dangling].sum() + (1 - damping_factor)
+        updated = damping_factor * (rows @ ranks) + spread * jump[active]
+        change = np.abs(updated - ranks[active])
+        residual = change.sum()
+        ranks[active] = updated
+        iterations += 1
+        if trace is not None:
+            trace.append((time.perf_counter() - started, residual))
+
+        if len(active) < n and residual <= tolerance:
+            # Frozen pages can still drift as the pages linking to them
+            # settle, so only stop after a full iteration also converges
+            active = np.arange(n)
+            rows = matrix
+            quiet = np.zeros(n, dtype=bool)
+            residual = np.inf
+            continue
+        settled = change < tolerance * updated
+        frozen = settled & quiet
+        quiet = settled
+        if frozen.any():
+            active = active[~frozen]
+            quiet = quiet[~frozen]
+            rows = matrix[active]
+
+    return ranks, iterations, residual
+
+
+SOLVERS = {
+    "power": power_iteration,
+    "gauss-seidel": gauss_seidel,
+    "extrapolation": extrapolated_iteration,
+    "adaptive": adaptive_iteration,
+}
+
+
+def forward_push(graph, teleport, damping_factor, epsilon=PUSH_EPSILON):
+    """
+    Approximates the PageRank vector personalized to `teleport`, a
+    dictionary of page index -> weight summing to 1, by pushing
+    probability mass outward from those pages only, so that just the
+    part of the graph near them is visited.
+
+    Returns (ranks, error): a dictionary of page index -> estimate for
+    the pages reached, and the mass left unpushed. Every estimate is
+    below its true value and together they fall short of it by exactly
+    `error` in L1, which ends below `epsilon` per link of the pages
+    holding it.
+    """
+    offsets, links = graph.out_links()
+    offsets = offsets.tolist()
+    links = links.tolist()
+    ranks = {}
+    residual = dict(teleport)
+    queue = deque(residual)
+    queued = set(queue)
+
+    def threshold(page):
+        return epsilon * max(1, offsets[page + 1] - offsets[page])
+
+    while queue:
+        page = queue.popleft()
+        queued.discard(page)
+        mass = residual[page]
+        if mass < threshold(page):
+            continue
+        residual[page] = 0.0
+        ranks[page] = ranks.get(page, 0.0) + (1 - damping_factor) * mass
+
+        start, end = offsets[page], offsets[page + 1]
+        if start == end:
+            # A dangling page's surfer jumps back to the teleport pages
+            targets = teleport.items()
+        else:
+            share = 1 / (end - start)
+            targets = ((target, share) for target in links[start:end])
+        for target, weight in targets:
+            residual[target] = residual.get(target, 0.0) + damping_factor * mass * weight
+            if target not in queued and residual[target] >= threshold(target):
+                queue.append(target)
+                queued.add(target)
+
+    return ranks, sum(residual.values())
+
+
+def _initial(n, start, teleport):
+    if teleport is None:
+        jump = np.full(n, 1 / n)
+    else:
+        jump = np.asarray(teleport, dtype=float)
+    ranks = jump.copy() if start is None else np.array(start, dtype=float)
+    return jump, ranks
+
+
+def _quadratic_extrapolation(x0, x1, x2, x3):
+    # Fit the error as a combination of the two slowest eigenvectors and
+    # solve it away; see Kamvar et al., "Extrapolation methods for
+    # accelerating PageRank computations"
+    y = np.column_stack([x1 - x0, x2 - x0])
+    (g1, g2), *_ = np.linalg.lstsq(y, -(x3 - x0), rcond=None)
+    g3 = 1.0
+    ranks = (g1 + g2 + g3) * x1 + (g2 + g3) * x2 + g3 * x3
+    np.maximum(ranks, 0, out=ranks)
+    total = ranks.sum()
+    return ranks / total if total > 0 else x3
+
+
+def random_surfers(graph, damping_factor, n, surfers=SURFERS, seed=None):
+    """
+    Estimates PageRank from `n` samples of the random surfer model,
+    advancing up to `surfers` independent surfers in lockstep. Each step,
+    a surfer follows a random link with probability `damping_factor`
+    and otherwise (or on a page without links) jumps to a random page.
+
+    Surfers start on random pages and take BURN_IN steps before their
+    visits are counted. Returns each page's share of the samples.
+    """
+    rng = np.random.default_rng(seed)
+    pages = len(graph)
+    if pages == 0 or n <= 0:
+        return np.zeros(pages)
+    offsets, links = graph.out_links()
+    degree = np.diff(offsets)
+    if len(links) == 0:
+        links = np.zeros(1, dtype=np.int64)
+    starts = offsets[:-1]
+
+    surfers = min(surfers, n)
+    position = rng.integers(0, pages, surfers)
+
+    def step(position):
+        # One uniform draw decides whether to follow a link and, scaled
+        # by 1 / damping_factor, which one
+        u = rng.random(surfers)
+        out = degree[position]
+        follow = (u < damping_factor) & (out > 0)
+        choice = starts[position] + (u * (1 / damping_factor) * out).astype(np.int64)
+        jump = rng.integers(0, pages, surfers)
+        return np.where(follow, np.take(links, choice, mode="clip"), jump)
+
+    for _ in range(BURN_IN):
+        position = step(position)
+
+    counts = np.zeros(pages, dtype=np.int64)
+    chunk = np.empty((max(1, CHUNK_SAMPLES // surfers), surfers), dtype=np.int64)
+    remaining = n
+    while remaining > 0:
+        steps = min(len(chunk), -(-remaining // surfers))
+        for k in range(steps):
+            chunk[k] = position
+            position = step(position)
+        visits = chunk[:steps].ravel()[:remaining]
+        counts += np.bincount(visits, minlength=pages)
+        remaining -= len(visits)
+
+    return counts / n
@@ -1,8 +1,15 @@
 import os
-import random
-import re
 import sys
 
+import numpy as np
+
+from crawler import LINK_PATTERN
+from crawlindex import load_corpus
+from engine import (
+    LinkGraph, PUSH_EPSILON, SOLVERS, TOLERANCE, forward_push,
+    power_iteration, random_surfers,
+)
+
 DAMPING = 0.85
 SAMPLES = 10000
 
@@ -10,7 +17,9 @@ SAMPLES = 10000
 def main():
     if len(sys.argv) != 2:
         sys.exit("Usage: python pagerank.py corpus")
-    corpus = crawl(sys.argv[1])
+    corpus, skipped, _changes = load_corpus(sys.argv[1])
+    for page in sorted(skipped):
+        print(f"Skipped {page}: {skipped[page]}", file=sys.stderr)
     ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
     print(f"PageRank Results from Sampling (n = {SAMPLES})")
     for page in sorted(ranks):
@@ -35,7 +44,7 @@ def crawl(directory):
             continue
         with open(os.path.join(directory, filename)) as f:
             contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
+            links = LINK_PATTERN.findall(contents)
             pages[filename] = set(links) - {filename}
 
     # Only include links to other pages in the corpus
@@ -49,20 +58,23 @@ def crawl(directory):
 
 
 # This is the page rank equation
-def transition_model(corpus, page, damping_factor):
+def transition_model(corpus, page, damping_factor, teleport=None):
     """
     Return a probability distribution over which page to visit next,
     given a current page.
 
     With probability `damping_factor`, choose a link at random
     linked to by `page`. With probability `1 - damping_factor`, choose
-    a link at random chosen from all pages in the corpus.
+    a link at random chosen from all pages in the corpus, or from the
+    `teleport` distribution if one is given.
     """
 
     pages = corpus.keys()
-    distribution = {
+    if teleport is None:
         # initialize with random distribution
-        page: (1 - damping_factor) / len(pages) for page in pages
+        teleport = {page: 1 / len(pages) for page in pages}
+    distribution = {
+        page: (1 - damping_factor) * teleport.get(page, 0) for page in pages
     }
 
     direct_links = set(corpus[page])
@@ -71,7 +83,7 @@ def transition_model(corpus, page, damping_factor):
 
     return distribution
 
-def sample_pagerank(corpus: dict[str], damping_factor, n):
+def sample_pagerank(corpus, damping_factor, n, seed=None):
     """
     Return PageRank values for each page by sampling `n` pages
     according to transition model, starting with a page at random.
@@ -79,30 +91,16 @@ def sample_pagerank(corpus: dict[str], damping_factor, n):
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
-    """
-
-    pages = corpus.keys()
-    ranks = {
-        p: 0 for p in pages
-    }
 
-    next = random.sample(sorted(pages), 1)[0]
-
-    for _ in range(n):
-        distribution = transition_model(corpus, next, damping_factor)
-        for page in pages:
-            ranks[page] += distribution[page]
-
-        links = corpus[next]
-        weights = [distribution[link] for link in links]
-        next = random.choices(sorted(links), weights=weights, k=1)[0]
-
-    for page in ranks:
-        ranks[page] /= n
-
-    return ranks
+    Many surfers are advanced at once with NumPy over precomputed link
+    arrays; `seed` makes the run reproducible.
+    """
+    graph = link_graph(corpus)
+    ranks = random_surfers(graph, damping_factor, n, seed=seed)
+    return graph.ranks_dict(ranks)
 
-def iterate_pagerank(corpus, damping_factor):
+def iterate_pagerank(corpus, damping_factor, tolerance=TOLERANCE,
+                     solver="power", trace=None):
     """
     Return PageRank values for each page by iteratively updating
     PageRank values until convergence.
@@ -110,32 +108,117 @@ def iterate_pagerank(corpus, damping_factor):
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
+
+    The corpus is turned into a sparse column-stochastic matrix and
+    iterated with NumPy until the L1 change is below `tolerance`, by
+    one of the SOLVERS: "power", "gauss-seidel", "extrapolation" or
+    "adaptive". If `trace` is a list, the solver appends an (elapsed
+    seconds, L1 change) pair to it every iteration.
     """
-    pages = corpus.keys()
-    
-    page_ranks = dict()
-
-    links_to = dict()
-    for k, v in corpus.items():
-        if links_to[v] is None:
-            links_to[v] = set()
-        links_to[v].add(k)
-
-# todo not doing the subtracting (giving away) thing yet.
-    diff = 1
-    ep = sys.float_info.epsilon
-    while(diff > ep):
-        for p in pages:
-            major_weight = 0
-            for link in links_to[p]:
-                major_weight += damping_factor * (page_ranks[link] / len(links_to[p]))
-
-            minor_weight = ((1 - damping_factor) / len(pages)) 
-            distribution = major_weight + minor_weight
-            page_ranks[p] = distribution
-            diff = max(distribution, diff)
-
-    return page_ranks
+    if solver not in SOLVERS:
+        raise ValueError(f"unknown solver: {solver}")
+    graph = link_graph(corpus)
+    matrix, dangling = graph.transition()
+    ranks, _iterations, _residual = SOLVERS[solver](
+        matrix, dangling, damping_factor, tolerance, trace=trace
+    )
+    return graph.ranks_dict(ranks)
+
+def update_pagerank(corpus, ranks, damping_factor, tolerance=TOLERANCE):
+    """
+    Return PageRank values for a corpus that has changed, iterating
+    from `ranks`, the values computed before the change, rather than
+    from a uniform start.
+
+    Return (ranks, iterations, residual): the PageRank dictionary, the
+    number of iterations taken and the final L1 change. Pages still in
+    the corpus start from their previous value and new pages from
+    1 / N, rescaled to sum to 1, so after a small change the iteration
+    starts close to the answer and stops after a few rounds.
+    """
+    graph = link_graph(corpus)
+    start = np.array([ranks.get(page, np.nan) for page in graph.pages])
+    if len(graph):
+        start[np.isnan(start)] = 1 / len(graph)
+        start /= start.sum()
+    matrix, dangling = graph.transition()
+    new_ranks, iterations, residual = power_iteration(
+        matrix, dangling, damping_factor, tolerance, start=start
+    )
+    return graph.ranks_dict(new_ranks), iterations, float(residual)
+
+
+def personalized_pagerank(corpus, damping_factor, teleports,
+                          tolerance=TOLERANCE):
+    """
+    Return PageRank values personalized to each of `teleports`, a
+    dictionary of name -> teleport set, where random jumps land only on
+    the teleport set's pages. A teleport set is a collection of pages,
+    jumped to evenly, or a dictionary of page -> weight.
+
+    Return a dictionary of name -> PageRank dictionary. All the teleport
+    sets are iterated together, as the columns of one rank matrix.
+    """
+    graph = link_graph(corpus)
+    index = {page: i for i, page in enumerate(graph.pages)}
+    names = list(teleports)
+    jump = np.zeros((len(graph), len(names)))
+    for k, name in enumerate(names):
+        for i, weight in teleport_weights(index, teleports[name]).items():
+            jump[i, k] = weight
+    matrix, dangling = graph.transition()
+    ranks, _iterations, _residual = power_iteration(
+        matrix, dangling, damping_factor, tolerance, teleport=jump
+    )
+    return {name: graph.ranks_dict(ranks[:, k]) for k, name in enumerate(names)}
+
+def push_pagerank(corpus, damping_factor, teleport, epsilon=PUSH_EPSILON):
+    """
+    Return approximate PageRank values personalized to one teleport set,
+    as for `personalized_pagerank`, computed by pushing rank out from
+    its pages so that only pages near them are visited.
+
+    Return (ranks, error): a dictionary of the pages reached and their
+    PageRank values, each an underestimate, and the total amount by
+    which they fall short. Smaller `epsilon` means a smaller error.
+    """
+    graph = link_graph(corpus)
+    index = {page: i for i, page in enumerate(graph.pages)}
+    ranks, error = forward_push(
+        graph, teleport_weights(index, teleport), damping_factor, epsilon
+    )
+    return {graph.pages[i]: rank for i, rank in ranks.items()}, error
+
+
+def teleport_weights(index, teleport):
+    """
+    Return `teleport`, a collection of pages or a dictionary of page ->
+    weight, as a dictionary of page number in `index` -> weight summing
+    to 1.
+    """
+    if not isinstance(teleport, dict):
+        teleport = dict.fromkeys(teleport, 1)
+    weights = {}
+    for page, weight in teleport.items():
+        if page not in index:
+            raise ValueError(f"teleport page not in corpus: {page}")
+        if weight > 0:
+            weights[index[page]] = weights.get(index[page], 0) + weight
+    total = sum(weights.values())
+    if not total:
+        raise ValueError("teleport set is empty")
+    return {i: weight / total for i, weight in weights.items()}
+
+
+def link_graph(corpus):
+    """
+    Return `corpus` as a LinkGraph, accepting either a `crawl`
+    dictionary or a LinkGraph from `crawl_graph`.
+    """
+    if isinstance(corpus, LinkGraph):
+        return corpus
+    return LinkGraph.from_corpus(corpus)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,182 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+import numpy as np
+import scipy.sparse
+
+from crawlindex import load_corpus
+from engine import MAX_ITERATIONS, TOLERANCE
+
+DAMPING = 0.85
+
+SHARD_META = "shards.json"
+
+# Shards opened by this pool worker, by directory
+_opened = {}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python sharded.py corpus [--shards DIR] [--processes N]")
+    parser.add_argument("corpus")
+    parser.add_argument("--shards", metavar="DIR",
+                        help="directory to keep the shards in "
+                             "(a temporary one by default)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--blocks", type=int,
+                        help="number of page blocks (one per process by "
+                             "default)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    graph, skipped, _changes = load_corpus(args.corpus)
+    for page in sorted(skipped):
+        print(f"Skipped {page}: {skipped[page]}", file=sys.stderr)
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = args.shards or scratch
+        write_shards(graph, directory, args.blocks or args.processes)
+        ranks, iterations, residual = sharded_pagerank(
+            directory, DAMPING, args.tolerance, args.processes
+        )
+    print(f"PageRank Results from {iterations} Sharded Iterations "
+          f"(residual {residual:.2e})")
+    for page, rank in sorted(graph.ranks_dict(ranks).items()):
+        print(f"  {page}: {rank:.4f}")
+
+
+def write_shards(graph, directory, blocks):
+    """
+    Splits `graph` into `blocks` contiguous blocks of pages and writes,
+    for each block, the rows of the link matrix leading into its pages
+    as CSR arrays in .npy files under `directory`, so that a worker
+    owning the block can memory-map just its own part of the graph.
+    """
+    os.makedirs(directory, exist_ok=True)
+    n = len(graph)
+    blocks = max(1, min(blocks, n))
+    bounds = [n * b // blocks for b in range(blocks + 1)]
+    degree = graph.out_degree()
+    index_type = np.int32 if len(graph.sources) < 2 ** 31 else np.int64
+
+    order = np.argsort(graph.targets, kind="stable")
+    targets = graph.targets[order]
+    sources = graph.sources[order]
+    for b in range(blocks):
+        lo, hi = bounds[b], bounds[b + 1]
+        start, end = np.searchsorted(targets, [lo, hi])
+        indptr = np.zeros(hi - lo + 1, dtype=index_type)
+        np.cumsum(np.bincount(targets[start:end] - lo, minlength=hi - lo),
+                  out=indptr[1:])
+        _save(directory, b, "indptr", indptr)
+        _save(directory, b, "indices", sources[start:end].astype(index_type))
+        _save(directory, b, "data", 1.0 / degree[sources[start:end]])
+
+    np.save(os.path.join(directory, "dangling.npy"), degree == 0)
+    with open(os.path.join(directory, SHARD_META), "w") as f:
+        json.dump({"pages": n, "bounds": bounds}, f)
+
+
+def sharded_pagerank(directory, damping_factor, tolerance=TOLERANCE,
+                     processes=None, max_iterations=MAX_ITERATIONS):
+    """
+    Runs power_iteration over the shards written to `directory` by
+    write_shards, one task per block of pages on a process pool. Each
+    iteration, every worker reads the shared rank vector and writes its
+    own block of the next one, both memory-mapped files, and reports
+    its block's L1 change and dangling rank.
+
+    Returns (ranks, iterations, residual) like power_iteration.
+    """
+    with open(os.path.join(directory, SHARD_META)) as f:
+        meta = json.load(f)
+    n = meta["pages"]
+    if n == 0:
+        return np.zeros(0), 0, 0.0
+    blocks = len(meta["bounds"]) - 1
+    dangling = np.load(os.path.join(directory, "dangling.npy"))
+
+    for buffer in range(2):
+        ranks = np.lib.format.open_memmap(
+            _ranks_path(directory, buffer), mode="w+", dtype=np.float64,
+            shape=(n,),
+        )
+        ranks[:] = 1 / n
+        del ranks
+    dangling_rank = dangling.sum() / n
+
+    current = 0
+    residual = np.inf
+    iterations = 0
+    with multiprocessing.Pool(processes) as pool:
+        while residual > tolerance and iterations < max_iterations:
+            spread = (damping_factor * dangling_rank + 1 - damping_factor) / n
+            results = pool.starmap(_iterate_block, [
+                (directory, b, current, damping_factor, spread)
+                for b in range(blocks)
+            ])
+            residual = sum(result[0] for result in results)
+            dangling_rank = sum(result[1] for result in results)
+            current = 1 - current
+            iterations += 1
+
+    ranks = np.load(_ranks_path(directory, current))
+    for buffer in range(2):
+        os.remove(_ranks_path(directory, buffer))
+    return ranks, iterations, residual
+
+
+def _iterate_block(directory, block, current, damping_factor, spread):
+    shards = _opened.get(directory)
+    if shards is None:
+        shards = _opened[directory] = _open_shards(directory)
+    lo, hi = shards["bounds"][block], shards["bounds"][block + 1]
+    ranks = shards["ranks"][current]
+    matrix = shards["blocks"][block]
+
+    new_ranks = damping_factor * (matrix @ ranks) + spread
+    residual = np.abs(new_ranks - ranks[lo:hi]).sum()
+    shards["ranks"][1 - current][lo:hi] = new_ranks
+    return residual, new_ranks[shards["dangling"][lo:hi]].sum()
+
+
+def _open_shards(directory):
+    with open(os.path.join(directory, SHARD_META)) as f:
+        meta = json.load(f)
+    n = meta["pages"]
+    bounds = meta["bounds"]
+    blocks = []
+    for b in range(len(bounds) - 1):
+        arrays = [_load(directory, b, name)
+                  for name in ("data", "indices", "indptr")]
+        blocks.append(scipy.sparse.csr_matrix(
+            tuple(arrays), shape=(bounds[b + 1] - bounds[b], n), copy=False
+        ))
+    return {
+        "bounds": bounds,
+        "blocks": blocks,
+        "dangling": np.load(os.path.join(directory, "dangling.npy"),
+                            mmap_mode="r"),
+        "ranks": [np.load(_ranks_path(directory, buffer), mmap_mode="r+")
+                  for buffer in range(2)],
+    }
+
+
+def _save(directory, block, name, array):
+    np.save(os.path.join(directory, f"block{block}.{name}.npy"), array)
+
+
+def _load(directory, block, name):
+    return np.load(os.path.join(directory, f"block{block}.{name}.npy"),
+                   mmap_mode="r")
+
+
+def _ranks_path(directory, buffer):
+    return os.path.join(directory, f"ranks{buffer}.npy")
+
+
+if __name__ == "__main__":
+    main()